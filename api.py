@@ -7,6 +7,7 @@ Exposes:
   - GET  /health
   - POST /submit        -> returns job_id
   - GET  /status/<id>   -> returns status/result
+  - POST /status        -> returns status/result for many job ids at once
 
 Also registers internal endpoints via Flask Blueprints:
   - worker_bp:  POST /process   (invoked by Cloud Tasks)
@@ -22,27 +23,141 @@ Architecture:
 from __future__ import annotations
 
 import os
-import json
 import uuid
+import hashlib
+import functools
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional
 
+import orjson
+import torch
 from flask import Flask, request, jsonify
+from google.api_core import exceptions as gexc
 from google.cloud import firestore
 from google.cloud import tasks_v2
 from google.protobuf import duration_pb2
 
-from worker import worker_bp
+from worker import worker_bp, get_cropper
 from cleanup import cleanup_bp
 from video_cropper import CropperConfig
 from logging_utils import setup_logging
 
 
+# Upper bound on job ids per POST /status call (one BatchGetDocuments RPC).
+MAX_BULK_STATUS_IDS = 100
+
+
 def now_utc() -> datetime:
     return datetime.now(timezone.utc)
 
 
+def _status_payload(job_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """Client-facing view of a job document."""
+    out: Dict[str, Any] = {
+        "job_id": job_id,
+        "status": data.get("status"),
+        "created_at_ts": getattr(data.get("created_at_ts"), "isoformat", lambda: None)(),
+        "updated_at_ts": getattr(data.get("updated_at_ts"), "isoformat", lambda: None)(),
+    }
+    if data.get("status") == "done":
+        out["result"] = data.get("result") or {}
+    if data.get("status") == "failed":
+        out["error"] = data.get("error")
+    return out
+
+
+def _parse_bool(value: str) -> bool:
+    return value not in ("0", "false", "False")
+
+
+# (CropperConfig field, env var, parser, default as the env string)
+_CROPPER_ENV_SPECS = (
+    ("model_name", "MODEL_NAME", str, "yolov8n.pt"),
+    ("backend", "MODEL_BACKEND", str, "auto"),
+    ("conf", "CONF", float, "0.25"),
+    ("iou", "IOU", float, "0.5"),
+    ("padding_ratio", "PADDING_RATIO", float, "0.12"),
+    ("min_crop_ratio", "MIN_CROP_RATIO", float, "0.35"),
+    ("smooth_alpha", "SMOOTH_ALPHA", float, "0.85"),
+    ("keep_aspect", "KEEP_ASPECT", _parse_bool, "1"),
+    ("draw_timestamp", "DRAW_TIMESTAMP", _parse_bool, "1"),
+    ("detect_batch_size", "DETECT_BATCH_SIZE", int, "0"),
+    ("detect_stride", "DETECT_STRIDE", int, "3"),
+    ("quantize", "QUANTIZE", _parse_bool, "0"),
+    ("frame_buffer_mb", "FRAME_BUFFER_MB", int, "2048"),
+    ("encoder", "VIDEO_ENCODER", str, "auto"),
+    ("crf", "CRF", int, "23"),
+    ("stream_upload", "STREAM_UPLOAD", _parse_bool, "1"),
+    ("stream_download", "STREAM_DOWNLOAD", _parse_bool, "1"),
+)
+
+
+def _cropper_config_from_env() -> CropperConfig:
+    env = os.environ
+    return CropperConfig(
+        **{field: parse(env.get(name, default)) for field, name, parse, default in _CROPPER_ENV_SPECS}
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def _gpu_static_info() -> Dict[str, Any]:
+    """
+    CUDA availability and device identity, queried once per process.
+
+    These involve driver calls and lazy CUDA init, and cannot change while the
+    process is running.
+    """
+    cuda_available = torch.cuda.is_available()
+    info: Dict[str, Any] = {"cuda_available": cuda_available}
+    if cuda_available:
+        info["device_count"] = torch.cuda.device_count()
+        info["device_name"] = torch.cuda.get_device_name(0)
+        info["memory_total_mb"] = round(torch.cuda.get_device_properties(0).total_memory / 1024 ** 2)
+    return info
+
+
+def _warm_clients(
+    db: firestore.Client,
+    tasks_client: tasks_v2.CloudTasksClient,
+    collection: str,
+    parent: str,
+    logger: logging.Logger,
+) -> None:
+    """
+    Open the Firestore and Cloud Tasks gRPC channels at startup.
+
+    The first RPC on a fresh channel pays DNS + TLS/ALPN setup; doing it here
+    keeps that cost off the first /submit and /status requests. Failures are
+    logged and ignored — the endpoints will surface real errors.
+    """
+    # Keep the Cloud Tasks channel connected instead of letting it go idle.
+    tasks_client.transport.grpc_channel.subscribe(lambda _state: None, try_to_connect=True)
+    try:
+        tasks_client.get_queue(name=parent)
+    except Exception as e:
+        logger.warning("warmup_tasks_failed error=%s", e)
+    try:
+        next(iter(db.collection(collection).limit(1).stream()), None)
+    except Exception as e:
+        logger.warning("warmup_firestore_failed error=%s", e)
+
+
+def _warm_cropper(app: Flask, logger: logging.Logger) -> None:
+    """
+    Build the VideoCropper singleton (model load, engine export, warm-up
+    inference) while the container is idle, instead of inside the first
+    /process request.
+    """
+    with app.app_context():
+        try:
+            get_cropper()
+        except Exception as e:
+            logger.warning("warmup_cropper_failed error=%s", e)
+
+
 def create_app() -> Flask:
     setup_logging()
     logger = logging.getLogger(__name__)
@@ -63,22 +178,45 @@ def create_app() -> Flask:
     queue_name = os.environ.get("TASKS_QUEUE", "video-cropper-queue")
     collection = os.environ.get("FIRESTORE_COLLECTION", "video_crop_jobs")
 
-    # Cropper config
-    cfg = CropperConfig(
-        model_name=os.environ.get("MODEL_NAME", "yolov8n.pt"),
-        conf=float(os.environ.get("CONF", "0.25")),
-        iou=float(os.environ.get("IOU", "0.5")),
-        padding_ratio=float(os.environ.get("PADDING_RATIO", "0.12")),
-        min_crop_ratio=float(os.environ.get("MIN_CROP_RATIO", "0.35")),
-        smooth_alpha=float(os.environ.get("SMOOTH_ALPHA", "0.85")),
-        keep_aspect=os.environ.get("KEEP_ASPECT", "1") not in ("0", "false", "False"),
-        draw_timestamp=os.environ.get("DRAW_TIMESTAMP", "1") not in ("0", "false", "False"),
-        detect_batch_size=int(os.environ.get("DETECT_BATCH_SIZE", "8")),
-    )
+    cfg = _cropper_config_from_env()
 
     # Clients
     db = firestore.Client()
     tasks_client = tasks_v2.CloudTasksClient()
+    # Runs the Cloud Tasks RPC alongside the Firestore write in /submit.
+    rpc_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="submit-rpc")
+
+    # Everything in a task except its name and body is a pure function of
+    # config, so build it once instead of per /submit.
+    parent = tasks_client.queue_path(project_id, region, queue_name)
+    task_template: Dict[str, Any] = {
+        "http_request": {
+            "http_method": tasks_v2.HttpMethod.POST,
+            "url": f"{service_url}/process",
+            "headers": {
+                "Content-Type": "application/json",
+                "X-Process-Token": process_token,  # defense-in-depth
+            },
+            "oidc_token": {
+                "service_account_email": tasks_invoker_sa_email,
+                "audience": service_url,
+            },
+        },
+        # Max dispatch deadline for HTTP targets (30 min). Cloud Tasks will not
+        # retry the task until this deadline has elapsed, preventing duplicate
+        # processing of long-running jobs.
+        "dispatch_deadline": duration_pb2.Duration(seconds=1800),
+    }
+
+    if project_id:
+        # Off the import path so gunicorn starts serving (and /health answers
+        # the startup probe) without waiting on TLS handshakes.
+        threading.Thread(
+            target=_warm_clients,
+            args=(db, tasks_client, collection, parent, logger),
+            name="warm-clients",
+            daemon=True,
+        ).start()
 
     app.config.update(
         DB=db,
@@ -92,8 +230,12 @@ def create_app() -> Flask:
         CLEANUP_TOKEN=cleanup_token,
         FIRESTORE_COLLECTION=collection,
         CROPPER_CONFIG=cfg,
+        TASKS_PARENT=parent,
+        TASK_TEMPLATE=task_template,
     )
 
+    threading.Thread(target=_warm_cropper, args=(app, logger), name="warm-cropper", daemon=True).start()
+
     if not project_id:
         logger.warning("PROJECT_ID is not set; Firestore operations will fail")
     if not service_url:
@@ -111,13 +253,9 @@ def create_app() -> Flask:
 
     @app.get("/gpu")
     def gpu_info() -> Any:
-        import torch
-        cuda_available = torch.cuda.is_available()
-        info: Dict[str, Any] = {"cuda_available": cuda_available}
-        if cuda_available:
-            info["device_count"] = torch.cuda.device_count()
-            info["device_name"] = torch.cuda.get_device_name(0)
-            info["memory_total_mb"] = round(torch.cuda.get_device_properties(0).total_memory / 1024 ** 2)
+        info: Dict[str, Any] = dict(_gpu_static_info())
+        if info["cuda_available"]:
+            # Allocator counters are cheap host-side reads; keep them live.
             info["memory_used_mb"] = round(torch.cuda.memory_allocated(0) / 1024 ** 2)
             info["memory_reserved_mb"] = round(torch.cuda.memory_reserved(0) / 1024 ** 2)
             info["memory_free_mb"] = info["memory_total_mb"] - info["memory_reserved_mb"]
@@ -144,63 +282,94 @@ def create_app() -> Flask:
         job_id = str(uuid.uuid4())
         ts = now_utc()
 
-        # Persist job
-        doc_ref = db.collection(collection).document(job_id)
-        doc_ref.set(
-            {
-                "job_id": job_id,
-                "uri": uri,
-                "status": "queued",
-                "created_at_ts": ts,
-                "updated_at_ts": ts,
-            }
-        )
-
-        # Enqueue Cloud Task to call /process
-        parent = tasks_client.queue_path(project_id, region, queue_name)
+        # Enqueue Cloud Task to call /process.
+        # Name the task explicitly: Cloud Tasks recommends uniformly distributed
+        # (hashed) task IDs over sequential ones, and a named task gives us
+        # server-side dedup — re-creating it returns ALREADY_EXISTS.
+        task_id = hashlib.sha256(job_id.encode()).hexdigest()[:32]
         task = {
+            **task_template,
+            "name": f"{parent}/tasks/{task_id}",
             "http_request": {
-                "http_method": tasks_v2.HttpMethod.POST,
-                "url": f"{service_url}/process",
-                "headers": {
-                    "Content-Type": "application/json",
-                    "X-Process-Token": process_token,  # defense-in-depth
-                },
-                "oidc_token": {
-                    "service_account_email": tasks_invoker_sa_email,
-                    "audience": service_url,
-                },
-                "body": json.dumps({"job_id": job_id}).encode(),
+                **task_template["http_request"],
+                "body": orjson.dumps({"job_id": job_id}),
             },
-            # Max dispatch deadline for HTTP targets (30 min). Cloud Tasks will not
-            # retry the task until this deadline has elapsed, preventing duplicate
-            # processing of long-running jobs.
-            "dispatch_deadline": duration_pb2.Duration(seconds=1800),
         }
-        tasks_client.create_task(parent=parent, task=task)
+
+        def _create_task() -> None:
+            try:
+                tasks_client.create_task(parent=parent, task=task)
+            except gexc.AlreadyExists:
+                logger.info("submit_task_exists job_id=%s task_id=%s", job_id, task_id)
+
+        # Persist job and enqueue the task concurrently so /submit pays one RPC
+        # round-trip instead of two. If the task is dispatched before the
+        # Firestore write lands, /process returns 404 and Cloud Tasks retries.
+        task_future = rpc_pool.submit(_create_task)
+        doc_ref = db.collection(collection).document(job_id)
+        try:
+            doc_ref.set(
+                {
+                    "job_id": job_id,
+                    "uri": uri,
+                    "status": "queued",
+                    "created_at_ts": ts,
+                    "updated_at_ts": ts,
+                }
+            )
+        except Exception:
+            # Don't leave a task behind for a job that was never stored: its
+            # /process calls would 404 until the queue's max attempts.
+            try:
+                task_future.result()
+            except Exception:
+                pass  # no task was created; the write error is what matters
+            else:
+                try:
+                    tasks_client.delete_task(name=task["name"])
+                except gexc.NotFound:
+                    pass
+                except Exception:
+                    logger.exception("submit_task_delete_failed job_id=%s task_id=%s", job_id, task_id)
+            raise
+        task_future.result()
 
         return jsonify({"job_id": job_id, "status": "queued"}), 202
 
+    def _get_statuses(job_ids: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Fetch jobs in a single BatchGetDocuments RPC; missing jobs map to None."""
+        col = db.collection(collection)
+        out: Dict[str, Optional[Dict[str, Any]]] = dict.fromkeys(job_ids)
+        for snap in db.get_all([col.document(j) for j in job_ids]):
+            if snap.exists:
+                out[snap.id] = _status_payload(snap.id, snap.to_dict() or {})
+        return out
+
     @app.get("/status/<job_id>")
     def status(job_id: str) -> Any:
-        doc_ref = db.collection(collection).document(job_id)
-        snap = doc_ref.get()
-        if not snap.exists:
+        out = _get_statuses([job_id])[job_id]
+        if out is None:
             return jsonify({"error": "Not found", "job_id": job_id}), 404
-
-        data = snap.to_dict() or {}
-        out: Dict[str, Any] = {
-            "job_id": job_id,
-            "status": data.get("status"),
-            "created_at_ts": getattr(data.get("created_at_ts"), "isoformat", lambda: None)(),
-            "updated_at_ts": getattr(data.get("updated_at_ts"), "isoformat", lambda: None)(),
-        }
-        if data.get("status") == "done":
-            out["result"] = data.get("result") or {}
-        if data.get("status") == "failed":
-            out["error"] = data.get("error")
         return jsonify(out), 200
 
+    @app.post("/status")
+    def status_bulk() -> Any:
+        data: Dict[str, Any] = request.get_json(silent=True) or {}
+        job_ids = data.get("job_ids")
+        if (
+            not isinstance(job_ids, list)
+            or not job_ids
+            or not all(isinstance(j, str) and j and "/" not in j for j in job_ids)
+        ):
+            return jsonify({"error": "job_ids must be a non-empty list of job id strings"}), 400
+        if len(job_ids) > MAX_BULK_STATUS_IDS:
+            return jsonify({"error": f"At most {MAX_BULK_STATUS_IDS} job_ids per request"}), 400
+
+        statuses = _get_statuses(job_ids)
+        return jsonify(
+            {j: out if out is not None else {"error": "Not found", "job_id": j} for j, out in statuses.items()}
+        ), 200
+
     return app
 
 
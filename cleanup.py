@@ -19,101 +19,192 @@ Security:
 from __future__ import annotations
 
 import os
+import hmac
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
-from typing import Any
+from typing import Any, Tuple
 
 from flask import Blueprint, request, jsonify, current_app
 from google.cloud import firestore
+from google.cloud.firestore_v1.bulk_writer import BulkWriteFailure, BulkWriter
+from google.rpc import code_pb2
 
-from logging_utils import setup_logging
+logger = logging.getLogger(__name__)
 
 cleanup_bp = Blueprint("cleanup", __name__)
 
+# Retry budget for transient BulkWriter failures (see _skip_not_found).
+_MAX_WRITE_ATTEMPTS = 15
+
 
 def now_utc() -> datetime:
     return datetime.now(timezone.utc)
 
 
+def _skip_not_found(failure: BulkWriteFailure, _bulk_writer: BulkWriter) -> bool:
+    """BulkWriter retry policy: don't retry writes to documents that are gone.
+
+    A stalled job can also be past retention, in which case the concurrent
+    retention sweep may delete it before the status update lands.
+    """
+    if failure.code == code_pb2.NOT_FOUND:
+        return False
+    return failure.attempts < _MAX_WRITE_ATTEMPTS
+
+
+class _WriteTally:
+    """Count BulkWriter outcomes as they settle, not when writes are queued.
+
+    The callbacks run on the writer's executor threads, hence the lock.
+    """
+
+    def __init__(self, bw: BulkWriter, sweep: str):
+        self._sweep = sweep
+        self._lock = threading.Lock()
+        self.succeeded = 0
+        self.failed = 0
+        bw.on_write_result(self._on_result)
+        bw.on_write_error(self._on_error)
+
+    def _on_result(self, _reference: Any, _result: Any, _bulk_writer: BulkWriter) -> None:
+        with self._lock:
+            self.succeeded += 1
+
+    def _on_error(self, failure: BulkWriteFailure, bulk_writer: BulkWriter) -> bool:
+        if _skip_not_found(failure, bulk_writer):
+            return True
+        if failure.code != code_pb2.NOT_FOUND:
+            # NOT_FOUND means the document is already gone; nothing to report.
+            logger.error(
+                "cleanup_write_failed sweep=%s doc=%s code=%s attempts=%d message=%s",
+                self._sweep, failure.operation.reference.path, failure.code, failure.attempts, failure.message,
+            )
+            with self._lock:
+                self.failed += 1
+        return False
+
+
+def _mark_stalled(
+    db: firestore.Client,
+    col: firestore.CollectionReference,
+    status: str,
+    stalled_cutoff: datetime,
+    stalled_minutes: int,
+    now_ts: datetime,
+) -> Tuple[int, int]:
+    """
+    Mark jobs stuck in `status` since before `stalled_cutoff` as failed.
+    Returns (marked, failed) write counts.
+    """
+    # Queries use an empty projection (select([])) so Firestore only returns
+    # document names; only d.reference is needed to write.
+    # BulkWriter pipelines commits in parallel and applies the 500/50/5 ramp-up
+    # throttling itself, so no manual 500-doc batching is needed here.
+    # Served by the composite index (status ASC, updated_at_ts ASC) — see the
+    # README's Firestore setup step. Equality first, then the range field, and
+    # an explicit order_by so the planner picks that index deterministically.
+    query = (
+        col.where("status", "==", status)
+        .where("updated_at_ts", "<", stalled_cutoff)
+        .order_by("updated_at_ts")
+        .select([])
+    )
+    bw = db.bulk_writer()
+    tally = _WriteTally(bw, f"stalled_{status}")
+    try:
+        for d in query.stream():
+            bw.update(
+                d.reference,
+                {
+                    "status": "failed",
+                    "error": f"stalled: no update in {stalled_minutes} minutes",
+                    "updated_at_ts": now_ts,
+                },
+            )
+    finally:
+        bw.close()  # flushes pending writes
+    return tally.succeeded, tally.failed
+
+
+def _delete_expired(
+    db: firestore.Client, col: firestore.CollectionReference, cutoff: datetime
+) -> Tuple[int, int]:
+    """Delete job documents created before `cutoff`. Returns (deleted, failed) write counts."""
+    bw = db.bulk_writer()
+    tally = _WriteTally(bw, "retention")
+    try:
+        for d in col.where("created_at_ts", "<", cutoff).select([]).stream():
+            bw.delete(d.reference)
+    finally:
+        bw.close()  # flushes pending writes
+    return tally.succeeded, tally.failed
+
+
 @cleanup_bp.post("/cleanup")
 def cleanup() -> Any:
-    setup_logging()
-    logger = logging.getLogger(__name__)
-
     cleanup_token = current_app.config.get("CLEANUP_TOKEN")
     if not cleanup_token:
         logger.error("cleanup_missing_token_config")
         return jsonify({"error": "Missing CLEANUP_TOKEN configuration"}), 500
 
-    if request.headers.get("X-Cleanup-Token") != cleanup_token:
+    # Length check first so junk probes are rejected without a full compare;
+    # compare_digest keeps the real comparison constant-time.
+    token = request.headers.get("X-Cleanup-Token", "")
+    if len(token) != len(cleanup_token) or not hmac.compare_digest(token.encode(), cleanup_token.encode()):
         return jsonify({"error": "Unauthorized"}), 401
 
     retention_days = int(os.environ.get("RETENTION_DAYS", "14"))
     stalled_minutes = int(os.environ.get("STALLED_MINUTES", "0"))
-    cutoff = now_utc() - timedelta(days=retention_days)
+    # One clock read for the whole sweep: both cutoffs and the stalled
+    # updated_at_ts derive from it.
+    now_ts = now_utc()
+    cutoff = now_ts - timedelta(days=retention_days)
 
     db: firestore.Client = current_app.config["DB"]
     collection = current_app.config["FIRESTORE_COLLECTION"]
     col = db.collection(collection)
 
-    deleted = 0
-    stalled_marked = 0
     stalled_cutoff = None
 
-    if stalled_minutes > 0:
-        stalled_cutoff = now_utc() - timedelta(minutes=stalled_minutes)
-        for status in ("queued", "processing"):
-            while True:
-                docs = list(
-                    col.where("status", "==", status)
-                    .where("updated_at_ts", "<", stalled_cutoff)
-                    .limit(500)
-                    .stream()
-                )
-                if not docs:
-                    break
-
-                batch = db.batch()
-                now_ts = now_utc()
-                for d in docs:
-                    batch.update(
-                        d.reference,
-                        {
-                            "status": "failed",
-                            "error": f"stalled: no update in {stalled_minutes} minutes",
-                            "updated_at_ts": now_ts,
-                        },
-                    )
-                    stalled_marked += 1
-                batch.commit()
-
-    while True:
-        docs = list(col.where("created_at_ts", "<", cutoff).limit(500).stream())
-        if not docs:
-            break
-
-        batch = db.batch()
-        for d in docs:
-            batch.delete(d.reference)
-            deleted += 1
-        batch.commit()
-
-    logger.info(
-        "cleanup_done deleted=%s cutoff=%s stalled_marked=%s stalled_cutoff=%s",
+    # The stalled scans and the retention sweep are independent and each is
+    # bound on Firestore round-trips, so run them side by side.
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        stalled_futures = []
+        if stalled_minutes > 0:
+            stalled_cutoff = now_ts - timedelta(minutes=stalled_minutes)
+            stalled_futures = [
+                pool.submit(_mark_stalled, db, col, status, stalled_cutoff, stalled_minutes, now_ts)
+                for status in ("queued", "processing")
+            ]
+        deleted_future = pool.submit(_delete_expired, db, col, cutoff)
+
+        stalled_results = [f.result() for f in stalled_futures]
+        deleted, delete_failed = deleted_future.result()
+    stalled_marked = sum(marked for marked, _ in stalled_results)
+    failed = delete_failed + sum(n for _, n in stalled_results)
+
+    log = logger.error if failed else logger.info
+    log(
+        "cleanup_done deleted=%s cutoff=%s stalled_marked=%s stalled_cutoff=%s failed=%s",
         deleted,
         cutoff.isoformat(),
         stalled_marked,
         stalled_cutoff.isoformat() if stalled_cutoff else None,
+        failed,
     )
+    # A 500 makes Cloud Scheduler retry the sweep; both sweeps are idempotent.
     return (
         jsonify(
             {
-                "ok": True,
+                "ok": not failed,
                 "deleted": deleted,
                 "cutoff": cutoff.isoformat(),
                 "stalled_marked": stalled_marked,
                 "stalled_cutoff": stalled_cutoff.isoformat() if stalled_cutoff else None,
+                "failed": failed,
             }
         ),
-        200,
+        500 if failed else 200,
     )
@@ -99,6 +99,12 @@ gcloud iam service-accounts add-iam-policy-binding "$RUNTIME_SA_EMAIL" \
   --role="roles/iam.serviceAccountUser" \
   --project="$PROJECT_ID" >/dev/null
 
+# Runtime SA signs the URLs ffmpeg streams gs:// inputs from (IAM signBlob on itself).
+gcloud iam service-accounts add-iam-policy-binding "$RUNTIME_SA_EMAIL" \
+  --member="serviceAccount:${RUNTIME_SA_EMAIL}" \
+  --role="roles/iam.serviceAccountTokenCreator" \
+  --project="$PROJECT_ID" >/dev/null
+
 echo "🔐 Fix for Cloud Tasks OIDC: allow runtime SA to 'actAs' the invoker SA..."
 gcloud iam service-accounts add-iam-policy-binding "$TASKS_INVOKER_SA_EMAIL"       --member="serviceAccount:${RUNTIME_SA_EMAIL}"       --role="roles/iam.serviceAccountUser"       --project="$PROJECT_ID" >/dev/null
 
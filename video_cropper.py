@@ -2,7 +2,7 @@
 video_cropper.py
 
 Core pipeline:
-  - download input video (gs:// or http(s)://)
+  - read input video (gs:// or http(s)://), streamed straight into ffmpeg
   - run person detection per frame
   - compute a stable crop window that removes irrelevant frame regions
   - optionally draw a per-frame timestamp on the top-right
@@ -12,26 +12,40 @@ Core pipeline:
 Notes:
 - This implementation uses Ultralytics YOLO (torch-based) on a GPU Cloud Run instance.
   Keep max-instances=1 per GPU; concurrency=8 allows status/health requests alongside processing.
+  Concurrent jobs in one process share the loaded model (detection calls are serialized).
 """
 
 from __future__ import annotations
 
 import os
+import json
 import math
+import re
+import collections
+import datetime
+import importlib.util
+import mimetypes
+import queue
 import time
 import shutil
 import logging
 import subprocess
 import tempfile
 import threading
-import queue as Q
 from dataclasses import dataclass
 from typing import Optional, Tuple, Dict, Any
 
 import cv2  # type: ignore
 import numpy as np  # type: ignore
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from numba import njit  # type: ignore
+import google.auth
+import google.auth.credentials
+from google.auth.transport.requests import Request as AuthRequest
 from google.cloud import storage
+from google.cloud.storage import transfer_manager
 
 from ultralytics import YOLO  # type: ignore
 
@@ -50,7 +64,15 @@ class CropperConfig:
     model_name: str = "yolov8n.pt"  # downloaded automatically by ultralytics
     conf: float = 0.25
     iou: float = 0.5
-    detect_batch_size: int = 8  # frames per YOLO call; larger = more GPU parallelism
+    detect_batch_size: int = 0  # frames per YOLO call; 0 = auto (fit GPU memory, or 4 on CPU)
+    backend: str = "auto"       # "torch", "tensorrt", "openvino", "onnx", or "auto" (tensorrt on CUDA, else openvino)
+    detect_stride: int = 3      # run YOLO on every Nth frame, reuse the crop in between; 1 = every frame
+    quantize: bool = False      # INT8 post-training quantization for the openvino backend
+    frame_buffer_mb: int = 2048  # host memory for queued full-resolution frames; bounds the frames per ring batch
+
+    # Encoding
+    encoder: str = "auto"  # "libx264", "h264_nvenc", or "auto" (h264_nvenc when it works here)
+    crf: int = 23          # constant quality (libx264 -crf / NVENC -cq); lower = better, bigger
 
     # Crop behavior
     padding_ratio: float = 0.12   # padding around union-of-people box relative to box size
@@ -67,6 +89,61 @@ class CropperConfig:
 
     # IO
     tmp_dir: str = "/tmp"
+    stream_download: bool = True  # ffmpeg reads the input over HTTP(S); False = download it to tmp_dir first
+    stream_upload: bool = True  # upload fragmented MP4 while encoding; False = write a file, then upload it
+
+    def __post_init__(self) -> None:
+        # A typo would otherwise fall through to the PyTorch model / libx264 unnoticed.
+        for field, allowed in (("backend", _BACKENDS), ("encoder", _ENCODERS)):
+            value = getattr(self, field)
+            if value not in allowed:
+                raise ValueError(f"Unknown {field} {value!r}; expected one of: {', '.join(allowed)}")
+
+
+# GCS objects at least this large are transferred as parallel 32 MiB chunks
+# (transfer_manager); below it the extra requests cost more than they save.
+_PARALLEL_TRANSFER_MIN_BYTES = 32 * 1024 * 1024
+_TRANSFER_CHUNK_BYTES = 32 * 1024 * 1024
+_TRANSFER_WORKERS = 8
+
+# YOLO input size; exported engines are built for exactly this.
+_DETECT_IMGSZ = 640
+
+# Exported model formats: backend -> (Ultralytics export format, fp16, file suffix).
+# Every export has a fixed input size and takes any batch up to its build
+# batch; the suffix is what Ultralytics uses to recognise the format when
+# loading it back.
+_EXPORT_FORMATS = {
+    "tensorrt": ("engine", True, ".engine"),
+    "openvino": ("openvino", False, "_openvino_model"),
+    "onnx": ("onnx", False, ".onnx"),
+}
+
+# Calibration images for INT8 export (Ultralytics downloads it on first use).
+_INT8_CALIBRATION_DATA = "coco128.yaml"
+
+# Accepted values of CropperConfig.backend / .encoder.
+_BACKENDS = ("auto", "torch", *_EXPORT_FORMATS)
+_ENCODERS = ("auto", "libx264", "h264_nvenc")
+
+# Backends to try in order; the PyTorch model is the last resort for all of them.
+_BACKEND_FALLBACKS = {"openvino": ("openvino", "onnx")}
+
+# Auto batch size bounds (detect_batch_size=0).
+_CPU_BATCH_SIZE = 4
+_MAX_AUTO_BATCH = 64
+
+# ffmpeg/ffprobe input options for reading over HTTP(S): retry dropped
+# connections instead of ending the input early.
+_FFMPEG_HTTP_ARGS = ("-reconnect", "1", "-reconnect_on_network_error", "1", "-reconnect_delay_max", "5")
+
+# Lifetime of the signed URLs ffmpeg streams gs:// inputs from. ffmpeg keeps
+# making range requests until the job ends, so this has to outlast the longest
+# job (the 60 min Cloud Run request timeout).
+_SIGNED_URL_TTL = datetime.timedelta(hours=2)
+
+# Every character a timestamp label (HH:MM:SS.mmm) can contain.
+_TIMESTAMP_CHARS = "0123456789:."
 
 
 def _parse_gs_uri(uri: str) -> Tuple[str, str]:
@@ -84,12 +161,165 @@ def _splitext_gs_path(blob_name: str) -> Tuple[str, str]:
     return base, ext
 
 
+def _cuda_available() -> bool:
+    import torch
+    return torch.cuda.is_available()
+
+
+def _probe_nvenc(logger: logging.Logger) -> bool:
+    """
+    Return True if ffmpeg can actually encode with h264_nvenc here.
+
+    Listing `ffmpeg -encoders` is not enough: distro ffmpeg builds advertise
+    NVENC even when no GPU / libnvidia-encode is present, so encode a few
+    blank frames to be sure.
+    """
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", "color=c=black:s=256x256:d=0.1",
+        "-c:v", "h264_nvenc", "-f", "null", "-",
+    ]
+    try:
+        ok = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=30).returncode == 0
+    except (OSError, subprocess.TimeoutExpired):
+        ok = False
+    logger.info("video_encoder %s", "h264_nvenc" if ok else "libx264")
+    return ok
+
+
+def _stderr_tail(data: bytes, src: str, name: str) -> str:
+    """
+    Last 800 characters of ffmpeg/ffprobe stderr for an error message, with
+    the input URL shown as `name`. ffmpeg prints the URL it was given, which
+    for a streamed gs:// input is a signed URL that must not reach job
+    status; the URL's path counts with any (or no) query string.
+    """
+    text = data.decode(errors="replace")
+    if src != name:
+        base = src.split("?", 1)[0]
+        text = re.sub(re.escape(base) + r"(\?[^\s:'\"]*)?", lambda _: name, text)
+    return text[-800:]
+
+
+def _probe_video(
+    path: str, input_args: Tuple[str, ...] = (), name: Optional[str] = None
+) -> Tuple[float, int, int, int, bool]:
+    """
+    (fps, width, height, frame_count) of the first video stream, via ffprobe,
+    plus whether the input has any audio stream.
+    Errors refer to the input as `name` (default: path).
+
+    Width and height are as decoded frames come out of ffmpeg, i.e. swapped
+    for streams with a +/-90 degree rotation, which ffmpeg applies on decode.
+    frame_count is 0 when the container doesn't record it.
+    """
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-show_entries", "stream=codec_type,width,height,avg_frame_rate,r_frame_rate,nb_frames"
+        ":stream_tags=rotate:stream_side_data=rotation",
+        "-of", "json", *input_args, path,
+    ]
+    try:
+        probe = subprocess.run(cmd, capture_output=True, timeout=60)
+    except (OSError, subprocess.TimeoutExpired) as exc:
+        # TimeoutExpired's message includes the command line, URL and all.
+        detail = _stderr_tail(str(exc).encode(), path, name or path)
+        raise ProcessingError(f"Failed to open input video: {detail}") from None
+    try:
+        streams = json.loads(probe.stdout)["streams"]
+        stream = next(s for s in streams if s.get("codec_type") == "video")
+    except (ValueError, KeyError, StopIteration):
+        detail = _stderr_tail(probe.stderr, path, name or path).strip() or "no video stream"
+        raise ProcessingError(f"Failed to open input video: {detail}") from None
+
+    fps = 0.0
+    for key in ("avg_frame_rate", "r_frame_rate"):
+        num, _, den = str(stream.get(key, "0/0")).partition("/")
+        try:
+            fps = float(num) / float(den or 1)
+        except (ValueError, ZeroDivisionError):
+            continue
+        if fps > 0:
+            break
+    width = int(stream.get("width") or 0)
+    height = int(stream.get("height") or 0)
+    rotation = stream.get("tags", {}).get("rotate")
+    for side_data in stream.get("side_data_list", []):
+        rotation = side_data.get("rotation", rotation)
+    if int(float(rotation or 0)) % 180 != 0:
+        width, height = height, width
+    nb_frames = str(stream.get("nb_frames", ""))
+    frame_count = int(nb_frames) if nb_frames.isdigit() else 0
+    has_audio = any(s.get("codec_type") == "audio" for s in streams)
+    return fps or 30.0, width, height, frame_count, has_audio
+
+
+def _read_exact(stream, buf: memoryview) -> bool:
+    """Fill buf from a binary stream. False on EOF before the first byte; raises on a partial read."""
+    got = 0
+    while got < len(buf):
+        n = stream.readinto(buf[got:])
+        if not n:
+            if got:
+                raise ProcessingError(f"Truncated frame from decoder ({got}/{len(buf)} bytes)")
+            return False
+        got += n
+    return True
+
+
+class _EncoderFailed(ProcessingError):
+    """Raised by _EncoderOutput when the encoder exits with an error."""
+
+
+class _EncoderOutput:
+    """
+    Read-only view of an encoder's stdout for Blob.upload_from_file.
+
+    Resumable uploads call tell() to track offsets, which a pipe can't answer,
+    so bytes are counted here. At EOF it waits for the encoder and raises if it
+    failed, so a truncated file is never finalized as the output object.
+    """
+
+    def __init__(self, proc: subprocess.Popen):
+        self._proc = proc
+        self._pos = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._proc.stdout.read(size)
+        self._pos += len(data)
+        if size < 0 or len(data) < size:
+            if self._proc.wait() != 0:
+                raise _EncoderFailed(f"Encoder exited with code {self._proc.returncode}; upload abandoned")
+        return data
+
+    def tell(self) -> int:
+        return self._pos
+
+
 class VideoIO:
     """Handles download/upload for gs:// and http(s):// URIs."""
 
     def __init__(self, storage_client: storage.Client, logger: logging.Logger):
         self._storage = storage_client
         self._logger = logger
+        self._buckets: Dict[str, storage.Bucket] = {}
+        self._gcs_credentials = None  # for ffmpeg reads of gs:// inputs, created on first use
+        # One pooled session for http(s) inputs: keep-alive connections are
+        # reused across jobs, and transient connect errors / 5xx are retried.
+        self._http = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=8,
+            max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=(500, 502, 503, 504)),
+        )
+        self._http.mount("http://", adapter)
+        self._http.mount("https://", adapter)
+
+    def _bucket(self, name: str) -> storage.Bucket:
+        bucket = self._buckets.get(name)
+        if bucket is None:
+            bucket = self._buckets[name] = self._storage.bucket(name)
+        return bucket
 
     def download(self, uri: str, dst_path: str) -> Dict[str, Any]:
         os.makedirs(os.path.dirname(dst_path), exist_ok=True)
@@ -97,14 +327,23 @@ class VideoIO:
         if uri.startswith("gs://"):
             bucket_name, blob_name = _parse_gs_uri(uri)
             self._logger.info("download_gcs uri=%s", uri)
-            bucket = self._storage.bucket(bucket_name)
-            blob = bucket.blob(blob_name)
-            blob.download_to_filename(dst_path)
+            blob = self._bucket(bucket_name).blob(blob_name)
+            blob.reload()  # size, plus the generation so every chunk reads the same object
+            if (blob.size or 0) >= _PARALLEL_TRANSFER_MIN_BYTES:
+                transfer_manager.download_chunks_concurrently(
+                    blob,
+                    dst_path,
+                    chunk_size=_TRANSFER_CHUNK_BYTES,
+                    worker_type=transfer_manager.THREAD,
+                    max_workers=_TRANSFER_WORKERS,
+                )
+            else:
+                blob.download_to_filename(dst_path)
             return {"scheme": "gs", "bucket": bucket_name, "blob": blob_name}
 
         if uri.startswith(("http://", "https://")):
             self._logger.info("download_http uri=%s", uri)
-            with requests.get(uri, stream=True, timeout=600) as r:
+            with self._http.get(uri, stream=True, timeout=600) as r:
                 r.raise_for_status()
                 with open(dst_path, "wb") as f:
                     for chunk in r.iter_content(chunk_size=1024 * 1024):
@@ -114,6 +353,57 @@ class VideoIO:
 
         raise DownloadError(f"Unsupported URI scheme: {uri}")
 
+    def ffmpeg_input(self, uri: str) -> Tuple[str, Tuple[str, ...]]:
+        """
+        (url, input options) for ffmpeg/ffprobe to read `uri` themselves, so
+        decoding starts on the first bytes instead of after a full download.
+
+        ffmpeg fetches with range requests, which MP4s with the index at the
+        end need, for as long as the job runs. gs:// objects are therefore
+        read through a V4 signed URL valid for _SIGNED_URL_TTL rather than
+        with a bearer token, which expires after an hour at most. Without a
+        private key (Cloud Run) the URL is signed by the IAM signBlob API,
+        which needs Token Creator on the runtime service account itself.
+        Credentials that can't sign (gcloud user credentials) raise
+        DownloadError; use stream_download=False with those.
+
+        The URL grants read access to the object, so it stays out of logs
+        and error messages (see _stderr_tail).
+        """
+        if uri.startswith("gs://"):
+            bucket_name, blob_name = _parse_gs_uri(uri)
+            self._logger.info("stream_gcs uri=%s", uri)
+            if self._gcs_credentials is None:
+                self._gcs_credentials, _ = google.auth.default(
+                    scopes=["https://www.googleapis.com/auth/cloud-platform"]
+                )
+            creds = self._gcs_credentials
+            if not creds.valid:
+                creds.refresh(AuthRequest())
+            blob = self._bucket(bucket_name).blob(blob_name)
+            if isinstance(creds, google.auth.credentials.Signing):
+                signer_args: Dict[str, Any] = {}
+            else:
+                signer_args = {
+                    "service_account_email": getattr(creds, "service_account_email", None),
+                    "access_token": creds.token,
+                }
+            try:
+                url = blob.generate_signed_url(
+                    version="v4", expiration=_SIGNED_URL_TTL, method="GET", credentials=creds, **signer_args
+                )
+            except Exception as exc:
+                raise DownloadError(
+                    f"Cannot sign a URL to stream {uri} ({exc}); set STREAM_DOWNLOAD=0 to download it instead"
+                ) from exc
+            return url, _FFMPEG_HTTP_ARGS
+
+        if uri.startswith(("http://", "https://")):
+            self._logger.info("stream_http uri=%s", uri)
+            return uri, _FFMPEG_HTTP_ARGS
+
+        raise DownloadError(f"Unsupported URI scheme: {uri}")
+
     def output_uri_for_input(self, input_uri: str, output_bucket_for_http: Optional[str]) -> str:
         if input_uri.startswith("gs://"):
             b, blob = _parse_gs_uri(input_uri)
@@ -135,9 +425,35 @@ class VideoIO:
         if not output_uri.startswith("gs://"):
             raise ProcessingError("Output URI must be gs://")
         b, blob = _parse_gs_uri(output_uri)
-        self._logger.info("upload_gcs output_uri=%s", output_uri)
-        bucket = self._storage.bucket(b)
-        bucket.blob(blob).upload_from_filename(local_path)
+        size = os.path.getsize(local_path)
+        self._logger.info("upload_gcs output_uri=%s bytes=%d", output_uri, size)
+        gcs_blob = self._bucket(b).blob(blob)
+        if size >= _PARALLEL_TRANSFER_MIN_BYTES:
+            # XML API multipart upload; set the type upload_from_filename would guess.
+            transfer_manager.upload_chunks_concurrently(
+                local_path,
+                gcs_blob,
+                content_type=mimetypes.guess_type(local_path)[0],
+                chunk_size=_TRANSFER_CHUNK_BYTES,
+                worker_type=transfer_manager.THREAD,
+                max_workers=_TRANSFER_WORKERS,
+            )
+        else:
+            gcs_blob.upload_from_filename(local_path)
+
+    def upload_stream(self, stream: Any, output_uri: str, content_type: str) -> None:
+        """
+        Upload a sequential stream whose size isn't known up front, as a
+        resumable upload of _TRANSFER_CHUNK_BYTES chunks sent as they are read.
+        The object is only created once the stream reaches EOF.
+        """
+        if not output_uri.startswith("gs://"):
+            raise ProcessingError("Output URI must be gs://")
+        b, blob = _parse_gs_uri(output_uri)
+        self._logger.info("upload_gcs_stream output_uri=%s", output_uri)
+        gcs_blob = self._bucket(b).blob(blob, chunk_size=_TRANSFER_CHUNK_BYTES)
+        gcs_blob.upload_from_file(stream, rewind=False, content_type=content_type)
+        self._logger.info("upload_gcs_stream_done output_uri=%s bytes=%d", output_uri, stream.tell())
 
 
 class PersonDetector:
@@ -147,48 +463,286 @@ class PersonDetector:
         self._cfg = cfg
         self._logger = logger
         self._model: Optional[YOLO] = None
+        # Set for exported models: the most frames they take per call.
+        self._max_batch: Optional[int] = None
+        self._batch_size = cfg.detect_batch_size  # resolved in _load()
+        self._small: Optional[np.ndarray] = None  # reused _downscale output
+        self._input: Optional[np.ndarray] = None  # reused _letterbox_cpu output
+        self._input_fit: Optional[Tuple[int, int]] = None  # (h, w) of the image area in _input
+        # Jobs share one detector: _load_lock makes the first load happen once,
+        # _infer_lock serializes detection (PyTorch models aren't re-entrant,
+        # and _small / _input are reused across calls).
+        self._load_lock = threading.Lock()
+        self._infer_lock = threading.Lock()
+
+    def _backend(self) -> str:
+        backend = self._cfg.backend
+        if backend == "auto":
+            import torch
+            if not torch.cuda.is_available():
+                return "openvino"
+            # Without the package Ultralytics would pip-install TensorRT at
+            # export time, on every cold start; the GPU image ships it.
+            if importlib.util.find_spec("tensorrt") is None:
+                self._logger.warning("tensorrt_not_installed backend=torch")
+                return "torch"
+            backend = "tensorrt"
+        return backend
 
     def _load(self) -> YOLO:
-        if self._model is None:
-            self._logger.info("loading_model name=%s", self._cfg.model_name)
-            self._model = YOLO(self._cfg.model_name)
+        if self._model is not None:
+            return self._model
+        with self._load_lock:
+            if self._model is None:
+                self._logger.info("loading_model name=%s", self._cfg.model_name)
+                self._configure_torch_threads()
+                model = YOLO(self._cfg.model_name)
+                self._batch_size = self._pick_batch_size(model)
+                backend = self._backend()
+                for name in _BACKEND_FALLBACKS.get(backend, (backend,)):
+                    if name in _EXPORT_FORMATS:
+                        exported = self._load_exported(model, name)
+                        if exported is not None:
+                            model = exported
+                            break
+                self._model = model
         return self._model
 
+    def _configure_torch_threads(self) -> None:
+        """
+        Size PyTorch's CPU thread pools for the torch backend: one intra-op
+        thread per CPU, and a single inter-op thread since predict runs one
+        graph at a time from one thread. Left alone on CUDA; the exported
+        backends have their own pools.
+        """
+        import torch
+        if torch.cuda.is_available():
+            return
+        threads = max(1, os.cpu_count() or 1)
+        torch.set_num_threads(threads)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass  # can only be set before the first inter-op parallel work
+        self._logger.info("torch_threads intra_op=%d inter_op=%d", threads, torch.get_num_interop_threads())
+
+    @property
+    def batch_size(self) -> int:
+        """Frames per detection call (loads the model, since auto-tuning needs it)."""
+        self._load()
+        return self._batch_size
+
+    def _pick_batch_size(self, model: YOLO) -> int:
+        """
+        Use cfg.detect_batch_size if set; 0 means auto.
+
+        Auto on CUDA asks Ultralytics' autobatch what fits in ~60% of free VRAM
+        and rounds down to a multiple of 32 (tensor-core friendly for FP16),
+        capped at _MAX_AUTO_BATCH. CPU falls back to a small fixed batch.
+        Host memory for the frames themselves is bounded separately, by
+        cfg.frame_buffer_mb (see VideoCropperJob.process_video).
+        """
+        if self._cfg.detect_batch_size > 0:
+            return self._cfg.detect_batch_size
+        import torch
+        if not torch.cuda.is_available():
+            return _CPU_BATCH_SIZE
+        from ultralytics.utils.autobatch import check_train_batch_size  # type: ignore
+        try:
+            model.model.to("cuda")
+            fit = check_train_batch_size(model.model, imgsz=_DETECT_IMGSZ, amp=True)
+        except Exception:
+            self._logger.exception("autobatch_failed")
+            fit = 32
+        batch = min(_MAX_AUTO_BATCH, max(32, fit // 32 * 32))
+        self._logger.info("detect_batch_size auto=%d fits=%d", batch, fit)
+        return batch
+
+    def _load_exported(self, model: YOLO, backend: str) -> Optional[YOLO]:
+        """
+        Export the PyTorch model for `backend` (see _EXPORT_FORMATS) and load
+        it: an FP16 TensorRT engine on GPU, or an FP32 OpenVINO / ONNX model
+        on CPU. With cfg.quantize the OpenVINO model is INT8, calibrated by
+        NNCF on _INT8_CALIBRATION_DATA.
+
+        Exports take any batch up to the build batch, so a call with only a
+        few keyframes (detect_stride, repeated frames) costs a few frames of
+        inference rather than a padded full batch.
+
+        Exporting takes seconds (TensorRT ~30 s), so the result is cached
+        under tmp_dir keyed by (model, batch, imgsz, precision) and reused by
+        later jobs in the same container. Returns None if the export fails.
+        """
+        fmt, half, suffix = _EXPORT_FORMATS[backend]
+        batch = self._batch_size
+        stem = os.path.splitext(os.path.basename(self._cfg.model_name))[0]
+        int8 = self._cfg.quantize and backend == "openvino"
+        precision = "int8" if int8 else "fp16" if half else "fp32"
+        int8_args = {"int8": True, "data": _INT8_CALIBRATION_DATA} if int8 else {}
+        shape = f"b{batch}dyn-{_DETECT_IMGSZ}"
+        export_path = os.path.join(self._cfg.tmp_dir, "yolo-engines", f"{stem}-{shape}-{precision}{suffix}")
+        if not os.path.exists(export_path):
+            self._logger.info(
+                "model_export format=%s precision=%s max_batch=%d imgsz=%d", fmt, precision, batch, _DETECT_IMGSZ
+            )
+            try:
+                # simplify=False: onnxslim isn't installed, and TensorRT / OpenVINO
+                # optimise the graph themselves.
+                exported = model.export(
+                    format=fmt, half=half, dynamic=True, batch=batch, imgsz=_DETECT_IMGSZ, simplify=False,
+                    **int8_args,
+                )
+            except Exception:
+                self._logger.exception("model_export_failed format=%s", fmt)
+                return None
+            os.makedirs(os.path.dirname(export_path), exist_ok=True)
+            shutil.move(exported, export_path)
+        self._logger.info("loading_exported_model backend=%s path=%s", backend, export_path)
+        self._max_batch = batch
+        return YOLO(export_path, task="detect")
+
     @staticmethod
-    def _boxes_to_union(res_item) -> Optional[Tuple[int, int, int, int]]:
-        if res_item.boxes is None or len(res_item.boxes) == 0:
-            return None
-        boxes = res_item.boxes.xyxy.cpu().numpy()
-        return (
-            int(np.min(boxes[:, 0])),
-            int(np.min(boxes[:, 1])),
-            int(np.max(boxes[:, 2])),
-            int(np.max(boxes[:, 3])),
-        )
+    def _boxes_to_union_batch(results: list) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Union of the person boxes for each YOLO result, as (xyxy float32 [B, 4], valid bool [B]).
+
+        The per-frame min/max stays on the results' device and the stacked
+        unions come back in a single device-to-host copy, instead of one
+        synchronizing .cpu() per frame.
+        """
+        import torch
+        valid = np.array([r.boxes is not None and len(r.boxes) > 0 for r in results], dtype=bool)
+        if not valid.any():
+            return np.zeros((len(results), 4), dtype=np.float32), valid
+        device = next(r.boxes.xyxy.device for r, ok in zip(results, valid) if ok)
+        empty = torch.zeros(4, device=device)
+        unions = [
+            torch.cat((r.boxes.xyxy[:, :2].amin(dim=0), r.boxes.xyxy[:, 2:].amax(dim=0))).float() if ok else empty
+            for r, ok in zip(results, valid)
+        ]
+        return torch.stack(unions).cpu().numpy(), valid
+
+    @staticmethod
+    def _letterbox_gpu(frames: Any) -> Tuple[Any, float, int, int]:
+        """
+        YOLO preprocessing on the device for a (B, H, W, 3) uint8 BGR tensor.
+
+        Resizes to fit _DETECT_IMGSZ, pads to a square with Ultralytics' grey
+        (114), swaps to RGB and scales to [0, 1]. Returns (B, 3, S, S) input
+        plus the scale and left/top padding needed to map boxes back.
+        """
+        import torch
+        import torch.nn.functional as F
+
+        _, h, w, _ = frames.shape
+        scale = _DETECT_IMGSZ / max(h, w)
+        new_h, new_w = max(1, round(h * scale)), max(1, round(w * scale))
+        left, top = (_DETECT_IMGSZ - new_w) // 2, (_DETECT_IMGSZ - new_h) // 2
+        dtype = torch.float16 if frames.is_cuda else torch.float32
+        x = frames.flip(-1).permute(0, 3, 1, 2).to(dtype)
+        x = F.interpolate(x, size=(new_h, new_w), mode="bilinear", align_corners=False)
+        out = x.new_full((len(frames), 3, _DETECT_IMGSZ, _DETECT_IMGSZ), 114.0)
+        out[:, :, top:top + new_h, left:left + new_w] = x
+        return out.div_(255.0), scale, left, top
+
+    def _downscale(self, frames: list) -> Tuple[list, float]:
+        """
+        Shrink same-size frames so the long side is _DETECT_IMGSZ, into a
+        buffer reused across calls. Returns (frames, scale); frames already
+        small enough are passed through with scale 1.
+        """
+        h, w = frames[0].shape[:2]
+        scale = _DETECT_IMGSZ / max(h, w)
+        if scale >= 1.0:
+            return list(frames), 1.0
+        size = (max(1, round(w * scale)), max(1, round(h * scale)))
+        shape = (len(frames), size[1], size[0], 3)
+        if self._small is None or self._small.shape[1:] != shape[1:] or len(self._small) < len(frames):
+            self._small = np.empty(shape, dtype=np.uint8)
+        small = [self._small[i] for i in range(len(frames))]
+        for frame, dst in zip(frames, small):
+            cv2.resize(frame, size, dst=dst, interpolation=cv2.INTER_AREA)
+        return small, scale
+
+    def _letterbox_cpu(self, frames: list) -> Tuple[Any, float, int, int]:
+        """
+        CPU counterpart of _letterbox_gpu for a list of same-size BGR frames.
+
+        After the INTER_AREA _downscale, each frame goes through one strided
+        pass (BGR->RGB, HWC->CHW, /255) into a float32 (B, 3, S, S) buffer that
+        is reused across calls. Its grey padding is only refilled when the
+        image area changes. Returns a CPU tensor view of the buffer.
+        """
+        import torch
+
+        small, scale = self._downscale(frames)
+        h, w = small[0].shape[:2]
+        left, top = (_DETECT_IMGSZ - w) // 2, (_DETECT_IMGSZ - h) // 2
+        if self._input is None or len(self._input) < len(small):
+            self._input = np.empty((len(small), 3, _DETECT_IMGSZ, _DETECT_IMGSZ), dtype=np.float32)
+            self._input_fit = None
+        if self._input_fit != (h, w):
+            self._input.fill(114 / 255)
+            self._input_fit = (h, w)
+        inputs = self._input[:len(small)]
+        for frame, dst in zip(small, inputs[:, :, top:top + h, left:left + w]):
+            np.multiply(frame[:, :, ::-1].transpose(2, 0, 1), np.float32(1 / 255), out=dst)
+        return torch.from_numpy(inputs), scale, left, top
 
     def detect_union_xyxy_batch(
-        self, frames_bgr: list
-    ) -> list:
+        self, frames_bgr: Any
+    ) -> Tuple[np.ndarray, np.ndarray]:
         """
-        Run YOLO on a list of frames in one batched call.
-        Returns a list of Optional[Tuple[x1,y1,x2,y2]], one per frame.
+        Run YOLO on a batch of BGR frames in one batched call.
+
+        frames_bgr is either a list of HxWx3 uint8 arrays (letterboxed by
+        _letterbox_cpu) or a (B, H, W, 3) uint8 CUDA tensor (letterboxed by
+        _letterbox_gpu). Either way YOLO gets a ready RGB NCHW tensor in
+        [0, 1] and skips its own per-call preprocessing.
+        Returns (xyxy, valid): an int32 [B, 4] array of union boxes and a bool
+        [B] mask of frames with at least one person (other rows are zero).
         Uses fp16 automatically when CUDA is available.
         """
         import torch
         model = self._load()
-        results = model.predict(
-            frames_bgr,
-            classes=[0],
-            conf=self._cfg.conf,
-            iou=self._cfg.iou,
-            verbose=False,
-            half=torch.cuda.is_available(),
-        )
-        return [self._boxes_to_union(r) for r in results]
+        n = len(frames_bgr)
+        if n == 0:
+            return np.zeros((0, 4), dtype=np.int32), np.zeros(0, dtype=bool)
+        on_device = isinstance(frames_bgr, torch.Tensor)
+        h, w = frames_bgr[0].shape[:2]
+        # No autograd bookkeeping for the letterbox or the predict call
+        # (Ultralytics only covers the latter itself).
+        with self._infer_lock, torch.inference_mode():
+            if on_device:
+                inputs, scale, left, top = self._letterbox_gpu(frames_bgr)
+            else:
+                inputs, scale, left, top = self._letterbox_cpu(frames_bgr)
+            xyxy = np.zeros((n, 4), dtype=np.float32)
+            valid = np.zeros(n, dtype=bool)
+            step = self._max_batch or n
+            for start in range(0, n, step):
+                results = model.predict(
+                    inputs[start:start + step],
+                    classes=[0],
+                    conf=self._cfg.conf,
+                    iou=self._cfg.iou,
+                    imgsz=_DETECT_IMGSZ,
+                    verbose=False,
+                    half=torch.cuda.is_available(),
+                )
+                chunk_xyxy, chunk_valid = self._boxes_to_union_batch(results)
+                xyxy[start:start + len(chunk_xyxy)] = chunk_xyxy
+                valid[start:start + len(chunk_valid)] = chunk_valid
+        # Boxes are in detector-input coordinates; map back to the frame.
+        xyxy[:, 0::2] = np.clip((xyxy[:, 0::2] - left) / scale, 0, w)
+        xyxy[:, 1::2] = np.clip((xyxy[:, 1::2] - top) / scale, 0, h)
+        xyxy[~valid] = 0
+        return xyxy.astype(np.int32), valid
 
     def detect_union_xyxy(self, frame_bgr: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
         """Single-frame convenience wrapper around the batch method."""
-        return self.detect_union_xyxy_batch([frame_bgr])[0]
+        xyxy, valid = self.detect_union_xyxy_batch([frame_bgr])
+        return tuple(int(v) for v in xyxy[0]) if valid[0] else None
 
 
 class CropWindowSmoother:
@@ -196,25 +750,250 @@ class CropWindowSmoother:
 
     def __init__(self, alpha: float):
         self._alpha = float(alpha)
-        self._prev: Optional[Tuple[float, float, float, float]] = None
-
-    def update(self, box: Tuple[float, float, float, float]) -> Tuple[float, float, float, float]:
-        if self._prev is None:
-            self._prev = box
-            return box
-        a = self._alpha
-        px1, py1, px2, py2 = self._prev
-        x1, y1, x2, y2 = box
-        smoothed = (a * px1 + (1 - a) * x1, a * py1 + (1 - a) * y1, a * px2 + (1 - a) * x2, a * py2 + (1 - a) * y2)
-        self._prev = smoothed
-        return smoothed
+        # EMA state [x1, y1, x2, y2], updated in place; meaningless until _primed.
+        self._prev_arr = np.zeros(4, dtype=np.float64)
+        self._primed = False
+
+    def crops(
+        self, xyxy: np.ndarray, valid: np.ndarray, w: int, h: int,
+        padding_ratio: float, min_crop_ratio: float, keep_aspect: bool,
+    ) -> np.ndarray:
+        """
+        Smoothed, clamped int64 [B, 4] crop windows for B detector outputs in
+        frame order (see _smoothed_crops_kernel); frames without persons get
+        the full frame and leave the EMA untouched.
+        """
+        out, self._primed = _smoothed_crops_kernel(
+            np.ascontiguousarray(xyxy), np.ascontiguousarray(valid), self._prev_arr, self._primed,
+            int(w), int(h), float(padding_ratio), float(min_crop_ratio), bool(keep_aspect), self._alpha,
+        )
+        return out
+
+
+@njit(cache=True)
+def _target_crop_kernel(
+    x1: int, y1: int, x2: int, y2: int, w: int, h: int,
+    padding_ratio: float, min_crop_ratio: float, keep_aspect: bool,
+) -> Tuple[int, int, int, int]:
+    """
+    Crop window for one detection box: padding, min-area expansion, aspect
+    correction and clamping. Scalar-only so Numba compiles it to native code;
+    it runs once per detected frame.
+    """
+    # padding
+    bw = max(1, x2 - x1)
+    bh = max(1, y2 - y1)
+    pad_x = int(padding_ratio * bw)
+    pad_y = int(padding_ratio * bh)
+
+    x1 = max(0, x1 - pad_x)
+    y1 = max(0, y1 - pad_y)
+    x2 = min(w, x2 + pad_x)
+    y2 = min(h, y2 + pad_y)
+
+    # enforce min crop ratio (area)
+    min_area = min_crop_ratio * (w * h)
+    cur_area = max(1, (x2 - x1) * (y2 - y1))
+    if cur_area < min_area:
+        # expand around center
+        cx = (x1 + x2) / 2.0
+        cy = (y1 + y2) / 2.0
+        target_area = min_area
+        target_side = math.sqrt(target_area)  # approx square; will be aspect corrected below
+        tw = target_side
+        th = target_side
+        x1 = int(max(0, cx - tw / 2))
+        x2 = int(min(w, cx + tw / 2))
+        y1 = int(max(0, cy - th / 2))
+        y2 = int(min(h, cy + th / 2))
+
+    # aspect keep: expand crop window to match original aspect
+    if keep_aspect:
+        target_aspect = w / h
+        cw = max(1, x2 - x1)
+        ch = max(1, y2 - y1)
+        cur_aspect = cw / ch
+
+        cx = (x1 + x2) / 2.0
+        cy = (y1 + y2) / 2.0
+
+        if cur_aspect > target_aspect:
+            # too wide -> increase height
+            new_h = cw / target_aspect
+            y1 = int(max(0, cy - new_h / 2))
+            y2 = int(min(h, cy + new_h / 2))
+        else:
+            # too tall -> increase width
+            new_w = ch * target_aspect
+            x1 = int(max(0, cx - new_w / 2))
+            x2 = int(min(w, cx + new_w / 2))
+
+    # clamp
+    x1 = max(0, min(w - 1, x1))
+    y1 = max(0, min(h - 1, y1))
+    x2 = max(x1 + 1, min(w, x2))
+    y2 = max(y1 + 1, min(h, y2))
+    return x1, y1, x2, y2
+
+
+@njit(cache=True)
+def _smoothed_crops_kernel(
+    xyxy: np.ndarray, valid: np.ndarray, prev: np.ndarray, primed: bool, w: int, h: int,
+    padding_ratio: float, min_crop_ratio: float, keep_aspect: bool, alpha: float,
+) -> Tuple[np.ndarray, bool]:
+    """
+    Target crop, EMA and clamp for each row of an int [B, 4] box array in one
+    native loop. `prev` is the float64 [4] EMA state and is updated in place;
+    returns the int64 [B, 4] crops and the new primed flag.
+    """
+    out = np.empty((xyxy.shape[0], 4), dtype=np.int64)
+    for i in range(xyxy.shape[0]):
+        if not valid[i]:
+            # No persons in this frame: full frame, smoother state unchanged.
+            out[i, 0] = 0
+            out[i, 1] = 0
+            out[i, 2] = w
+            out[i, 3] = h
+            continue
+        t = _target_crop_kernel(
+            xyxy[i, 0], xyxy[i, 1], xyxy[i, 2], xyxy[i, 3], w, h,
+            padding_ratio, min_crop_ratio, keep_aspect,
+        )
+        for j in range(4):
+            if primed:
+                prev[j] = alpha * prev[j] + (1 - alpha) * t[j]
+            else:
+                prev[j] = t[j]
+        primed = True
+        x1 = max(0, min(w - 1, int(prev[0])))
+        y1 = max(0, min(h - 1, int(prev[1])))
+        out[i, 0] = x1
+        out[i, 1] = y1
+        out[i, 2] = max(x1 + 1, min(w, int(prev[2])))
+        out[i, 3] = max(y1 + 1, min(h, int(prev[3])))
+    return out, primed
+
+
+class FrameRing:
+    """
+    Fixed pool of preallocated (batch_size, H, W, 3) frame buffers shared by a
+    producer and a consumer thread.
+
+    The producer acquires a free slot, decodes straight into it and publishes
+    it; the consumer takes published slots in order and releases them once the
+    frames are no longer needed. No per-frame allocation, and at most `slots`
+    batches exist at any time. close() wakes both sides so they can exit.
+
+    With pinned=True the buffers are page-locked (via torch) so batches can be
+    copied to the GPU asynchronously, without a staging copy.
+    """
+
+    def __init__(self, slots: int, batch_size: int, h: int, w: int, pinned: bool = False):
+        shape = (batch_size, h, w, 3)
+        if pinned:
+            import torch
+            self._pinned = [torch.empty(shape, dtype=torch.uint8, pin_memory=True) for _ in range(slots)]
+            self.slots = [t.numpy() for t in self._pinned]
+        else:
+            self.slots = [np.empty(shape, dtype=np.uint8) for _ in range(slots)]
+        self._free = collections.deque(range(slots))
+        self._ready: collections.deque = collections.deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def acquire(self) -> Optional[int]:
+        """Index of a free slot, or None once the ring is closed."""
+        with self._cond:
+            while not self._free and not self._closed:
+                self._cond.wait()
+            return None if self._closed else self._free.popleft()
+
+    def publish(self, item: Any) -> None:
+        """Hand (slot, n_frames), an Exception or the None end marker to the consumer."""
+        with self._cond:
+            self._ready.append(item)
+            self._cond.notify_all()
+
+    def take(self) -> Any:
+        """Next published item; None at the end or once the ring is closed."""
+        with self._cond:
+            while not self._ready and not self._closed:
+                self._cond.wait()
+            return None if self._closed else self._ready.popleft()
+
+    def release(self, slot: int) -> None:
+        with self._cond:
+            self._free.append(slot)
+            self._cond.notify_all()
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class _AudioRelay:
+    """
+    Carries the audio tracks the decoder copies out of the input to the
+    encoder, so the input is read once.
+
+    The decoder writes audio as soon as it demuxes it, while the matching
+    frames are still in the rings, and the encoder only takes audio once its
+    video has caught up. Over a single pipe a high-bitrate track (PCM fills
+    64 KB in a fraction of a second) would block the decoder, and with it the
+    frames the encoder is waiting for. Instead two threads pass it through an
+    unbounded queue, which holds about the audio for the frames in flight.
+    """
+
+    def __init__(self):
+        self._src, self.decoder_fd = os.pipe()  # the decoder writes decoder_fd
+        self.encoder_fd, self._dst = os.pipe()  # the encoder reads encoder_fd
+        self._chunks: queue.Queue = queue.Queue()
+
+    def start(self) -> None:
+        """Start relaying once both processes have inherited their ends."""
+        # Only the children may hold their ends, or EOF would never arrive.
+        os.close(self.decoder_fd)
+        os.close(self.encoder_fd)
+        threading.Thread(target=self._read, name="audio-read", daemon=True).start()
+        threading.Thread(target=self._write, name="audio-write", daemon=True).start()
+
+    def close(self) -> None:
+        """Release the pipes of a relay that was never started."""
+        for fd in (self._src, self.decoder_fd, self.encoder_fd, self._dst):
+            os.close(fd)
+
+    def _read(self) -> None:
+        try:
+            while True:
+                chunk = os.read(self._src, 1 << 16)
+                if not chunk:
+                    return
+                self._chunks.put(chunk)
+        finally:
+            os.close(self._src)
+            self._chunks.put(None)
 
-    def get(self) -> Optional[Tuple[float, float, float, float]]:
-        return self._prev
+    def _write(self) -> None:
+        try:
+            while True:
+                chunk = self._chunks.get()
+                if chunk is None:
+                    return
+                view = memoryview(chunk)
+                while view:
+                    view = view[os.write(self._dst, view):]
+        except OSError:
+            pass  # encoder gone; its exit status reports the failure
+        finally:
+            os.close(self._dst)
 
 
 class VideoCropper:
-    """End-to-end crop pipeline."""
+    """
+    End-to-end crop pipeline. Holds what jobs share (config, storage I/O,
+    the loaded detector); each run() does its work in a VideoCropperJob.
+    """
 
     def __init__(self, cfg: CropperConfig, logger: logging.Logger):
         self.cfg = cfg
@@ -222,11 +1001,21 @@ class VideoCropper:
         self.storage_client = storage.Client()
         self.io = VideoIO(self.storage_client, logger)
         self.detector = PersonDetector(cfg, logger)
-        self.smoother = CropWindowSmoother(cfg.smooth_alpha)
+        self._use_nvenc = cfg.encoder == "h264_nvenc" or (cfg.encoder == "auto" and _probe_nvenc(logger))
+        self._use_cuda = _cuda_available()
+        # The PyPI wheels ship IPP and dispatch to AVX2/AVX-512 at runtime;
+        # log it so a build without them shows up in the service logs.
+        logger.info(
+            "opencv_build version=%s optimized=%s ipp=%s",
+            cv2.__version__, cv2.useOptimized(), cv2.ipp.getIppVersion() if cv2.ipp.useIPP() else "off",
+        )
+        self._glyphs = self._render_timestamp_glyphs()
+        # Compile (or load from cache) the crop kernels now, not on the first frame.
+        CropWindowSmoother(0.5).crops(np.array([[0, 0, 2, 2]], dtype=np.int32), np.ones(1, dtype=bool), 4, 4, 0.0, 0.0, True)
 
     def run(self, input_uri: str) -> Dict[str, Any]:
-        # Reset smoother so state from a previous job doesn't bleed into this one.
-        self.smoother = CropWindowSmoother(self.cfg.smooth_alpha)
+        # Fresh per-job state, so neither earlier nor concurrent jobs leak into this one.
+        job = VideoCropperJob(self)
 
         job_tmp = tempfile.mkdtemp(prefix="video-crop-", dir=self.cfg.tmp_dir)
         in_path = os.path.join(job_tmp, "input.mp4")
@@ -240,222 +1029,535 @@ class VideoCropper:
         self.logger.info("run_start input_uri=%s output_uri=%s", input_uri, output_uri)
         t0 = time.monotonic()
         try:
-            self.io.download(input_uri, in_path)
-            self._process_video(in_path, out_path)
-            self.io.upload(out_path, output_uri)
+            # Load the model (first job per container) while the input is fetched.
+            # Errors are not lost: the infer stage calls _load() again and raises.
+            loader = threading.Thread(target=self._preload_model, name="model-load", daemon=True)
+            loader.start()
+            if self.cfg.stream_download:
+                src, src_args = self.io.ffmpeg_input(input_uri)
+            else:
+                self.io.download(input_uri, in_path)
+                src, src_args = in_path, ()
+            loader.join()
+            if self.cfg.stream_upload:
+                job.process_video(src, output_uri=output_uri, input_args=src_args, src_name=input_uri)
+            else:
+                job.process_video(src, out_path=out_path, input_args=src_args, src_name=input_uri)
+                self.io.upload(out_path, output_uri)
             elapsed = time.monotonic() - t0
             self.logger.info("run_complete output_uri=%s elapsed_s=%.1f", output_uri, elapsed)
             return meta
         finally:
             shutil.rmtree(job_tmp, ignore_errors=True)
 
-    def _process_video(self, in_path: str, out_path: str) -> None:
-        cap = cv2.VideoCapture(in_path)
-        if not cap.isOpened():
-            raise ProcessingError("Failed to open input video")
+    def warmup(self) -> None:
+        """
+        Load the detector (exporting it on the first start of a container) and
+        run one blank frame through it, so the first job pays for neither.
+        """
+        t0 = time.monotonic()
+        self.detector.detect_union_xyxy(np.zeros((_DETECT_IMGSZ, _DETECT_IMGSZ, 3), dtype=np.uint8))
+        self.logger.info("warmup_complete elapsed_s=%.1f", time.monotonic() - t0)
 
-        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
-        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    def _preload_model(self) -> None:
+        try:
+            self.detector._load()
+        except Exception:
+            self.logger.exception("model_preload_failed")
+
+    def _render_timestamp_glyphs(self) -> Dict[str, np.ndarray]:
+        """
+        Pre-render each timestamp character once as a white-on-black cell.
 
+        Cells span the full height of the background box (6 px padding above
+        and below the text), and all digits share the widest digit's width so
+        the label has a fixed width and can be blitted with plain slice copies.
+        """
+        font = cv2.FONT_HERSHEY_SIMPLEX
+        scale = self.cfg.timestamp_font_scale
+        thickness = self.cfg.timestamp_thickness
+        (_tw, th), baseline = cv2.getTextSize("00:00:00.000", font, scale, thickness)
+        sizes = {c: cv2.getTextSize(c, font, scale, thickness)[0][0] for c in _TIMESTAMP_CHARS}
+        digit_w = max(sizes[c] for c in "0123456789")
+
+        glyphs: Dict[str, np.ndarray] = {}
+        for c in _TIMESTAMP_CHARS:
+            cw = digit_w if c.isdigit() else sizes[c]
+            cell = np.zeros((th + baseline + 12, cw, 3), dtype=np.uint8)
+            cv2.putText(
+                cell, c, ((cw - sizes[c]) // 2, 6 + th), font,
+                scale, (255, 255, 255), thickness, cv2.LINE_AA,
+            )
+            glyphs[c] = cell
+        return glyphs
+
+
+class VideoCropperJob:
+    """
+    Mutable state for one VideoCropper.run(): the crop smoother, the window
+    carried between batches, the CUDA copy stream and the timestamp strip.
+
+    The detector, I/O clients and glyphs come from the shared VideoCropper,
+    so several jobs can run in the same process at once.
+    """
+
+    def __init__(self, service: VideoCropper):
+        self.cfg = service.cfg
+        self.logger = service.logger
+        self.io = service.io
+        self.detector = service.detector
+        self._glyphs = service._glyphs
+        self._use_nvenc = service._use_nvenc
+        self._use_cuda = service._use_cuda
+        self.smoother = CropWindowSmoother(self.cfg.smooth_alpha)
+        self._last_crop: Optional[Tuple[int, int, int, int]] = None
+        self._copy_stream = None  # CUDA side stream for frame uploads, created on first use
+        self._timestamp_strip: Optional[Tuple[str, np.ndarray]] = None  # see _timestamp_prefix_strip
+
+    def process_video(
+        self,
+        src: str,
+        out_path: Optional[str] = None,
+        output_uri: Optional[str] = None,
+        input_args: Tuple[str, ...] = (),
+        src_name: Optional[str] = None,
+    ) -> None:
+        """
+        Crop src (a local path, or a URL read with input_args) into out_path,
+        or, given output_uri instead, upload the encoder's output there while
+        it is still encoding. Errors refer to the input as src_name (default:
+        src), so a signed src URL is never exposed.
+        """
+        src_name = src_name or src
+        fps, width, height, frame_count, has_audio = _probe_video(src, input_args, src_name)
         if width == 0 or height == 0:
             raise ProcessingError(f"Invalid video dimensions: {width}x{height}")
 
-        self.logger.info("video_info fps=%.3f w=%d h=%d frames=%d", fps, width, height, frame_count)
-
-        # Pipe raw BGR frames directly into ffmpeg to encode H.264 and mux original audio.
-        cmd = [
-            "ffmpeg", "-y",
-            "-f", "rawvideo", "-vcodec", "rawvideo",
-            "-s", f"{width}x{height}",
-            "-pix_fmt", "bgr24",
-            "-r", str(fps),
-            "-i", "pipe:0",   # processed frames from stdin
-            "-i", in_path,    # original file for audio track
-            "-map", "0:v:0",
-            "-map", "1:a?",   # optional: copy audio if present
-            "-c:v", "libx264",
-            "-preset", "fast",
-            "-crf", "23",
-            "-movflags", "+faststart",
-            "-c:a", "aac",
-            "-shortest",
-            out_path,
-        ]
-
-        # Producer-consumer: a reader thread pre-fetches batches of frames while
-        # the main thread runs YOLO inference on the GPU. This keeps the GPU fed
-        # instead of stalling on sequential cap.read() calls.
-        # TemporaryFile for ffmpeg stderr avoids the 64 KB pipe-buffer deadlock.
-        batch_size = self.cfg.detect_batch_size
-        frame_queue: Q.Queue = Q.Queue(maxsize=4)  # buffer up to 4 batches ahead
+        self.logger.info(
+            "video_info fps=%.3f w=%d h=%d frames=%d audio=%s decoder=%s",
+            fps, width, height, frame_count, has_audio, "cuda" if self._use_cuda else "cpu",
+        )
 
-        def _reader() -> None:
-            buf: list = []
-            idx = 0
+        # Three-stage pipeline over two rings of preallocated frame batches:
+        #   reader thread (decoder stdout into frames_in) -> infer thread (YOLO +
+        #   crop into frames_out) -> main thread (frames_out -> ffmpeg stdin)
+        # Throughput is bounded by the slowest stage rather than the sum, so the
+        # GPU keeps working while ffmpeg applies pipe backpressure.
+        # Each ring carries (slot, n) batches, then a None sentinel or an Exception.
+        # TemporaryFiles for ffmpeg stderr avoid the 64 KB pipe-buffer deadlock.
+        # Per ring: up to two filled batches waiting plus the one being worked
+        # on, enough to keep every stage fed. A ring batch holds detect_stride
+        # frames per detector slot, so its keyframes fill about one detection
+        # call, unless the two rings' slots would then exceed frame_buffer_mb
+        # (at 4K one frame is ~25 MB).
+        slots = 3
+        batch_size = self.detector.batch_size * max(1, self.cfg.detect_stride)
+        budget = self.cfg.frame_buffer_mb * 1024 * 1024 // (2 * slots * height * width * 3)
+        batch_size = max(1, min(batch_size, budget))
+        self.logger.info("frame_rings batch=%d slots=%d", batch_size, slots)
+        frames_in = FrameRing(slots, batch_size, height, width, pinned=self._use_cuda)
+        frames_out = FrameRing(slots, batch_size, height, width, pinned=self._use_cuda)
+
+        if output_uri:
+            # Fragmented MP4 never seeks back to write the index, so ffmpeg
+            # can emit it to a pipe that is uploaded as it is produced.
+            output_args = ["-movflags", "+frag_keyframe+empty_moov", "-f", "mp4", "pipe:1"]
+        else:
+            output_args = ["-movflags", "+faststart", out_path]
+
+        with tempfile.TemporaryFile() as decode_err, tempfile.TemporaryFile() as stderr_f:
+            # The decoder also copies the audio tracks out (as NUT, which
+            # carries any codec) for the encoder to mux; see _AudioRelay.
+            audio = _AudioRelay() if has_audio else None
             try:
-                while True:
-                    ok, frame = cap.read()
-                    if not ok:
-                        if buf:
-                            frame_queue.put(buf)
-                        frame_queue.put(None)  # sentinel: no more batches
-                        break
-                    buf.append((idx, frame))
-                    idx += 1
-                    if len(buf) >= batch_size:
-                        frame_queue.put(buf)
-                        buf = []
-            except Exception as exc:
-                frame_queue.put(exc)  # propagate errors to main thread
-
-        reader_thread = threading.Thread(target=_reader, daemon=True)
-        reader_thread.start()
+                # Decode with an ffmpeg subprocess writing raw BGR frames to a pipe;
+                # every decoded frame is passed through (no fps conversion), and
+                # rotation metadata is applied as _probe_video assumes.
+                decode_cmd = [
+                    "ffmpeg", "-nostdin", "-loglevel", "error",
+                    *self._video_decoder_args(),
+                    *input_args,
+                    "-i", src,
+                    "-map", "0:v:0",
+                    "-fps_mode", "passthrough",
+                    "-f", "rawvideo", "-pix_fmt", "bgr24",
+                    "pipe:1",
+                ]
+                audio_in: list = []
+                audio_map: list = []
+                if audio:
+                    decode_cmd += ["-map", "0:a", "-c:a", "copy", "-f", "nut", f"pipe:{audio.decoder_fd}"]
+                    audio_in = ["-f", "nut", "-i", f"pipe:{audio.encoder_fd}"]
+                    audio_map = ["-map", "1:a"]
+
+                # Pipe raw BGR frames directly into ffmpeg to encode H.264 and mux original audio.
+                cmd = [
+                    "ffmpeg", "-y",
+                    "-f", "rawvideo", "-vcodec", "rawvideo",
+                    "-s", f"{width}x{height}",
+                    "-pix_fmt", "bgr24",
+                    "-r", str(fps),
+                    "-i", "pipe:0",   # processed frames from stdin
+                    *audio_in,        # original audio from the decoder
+                    "-map", "0:v:0",
+                    *audio_map,
+                    *self._video_encoder_args(),
+                    "-c:a", "aac",
+                    "-shortest",
+                    *output_args,
+                ]
+
+                decoder = subprocess.Popen(
+                    decode_cmd, stdout=subprocess.PIPE, stderr=decode_err, pass_fds=(audio.decoder_fd,) if audio else ()
+                )
+                try:
+                    proc = subprocess.Popen(
+                        cmd,
+                        stdin=subprocess.PIPE,
+                        stdout=subprocess.PIPE if output_uri else None,
+                        stderr=stderr_f,
+                        pass_fds=(audio.encoder_fd,) if audio else (),
+                    )
+                except BaseException:
+                    decoder.kill()
+                    decoder.wait()
+                    raise
+            except BaseException:
+                if audio:
+                    audio.close()
+                raise
+            if audio:
+                audio.start()
+
+            def _reader() -> None:
+                try:
+                    while True:
+                        slot = frames_in.acquire()
+                        if slot is None:
+                            return
+                        frames = frames_in.slots[slot]
+                        n = 0
+                        # Read each frame straight into its slot; no per-frame allocation.
+                        while n < batch_size and _read_exact(decoder.stdout, memoryview(frames[n]).cast("B")):
+                            n += 1
+                        if n:
+                            frames_in.publish((slot, n))
+                        if n < batch_size:
+                            if decoder.wait() != 0:
+                                decode_err.seek(0)
+                                raise ProcessingError(
+                                    f"ffmpeg decode failed: {_stderr_tail(decode_err.read(), src, src_name)}"
+                                )
+                            frames_in.publish(None)  # sentinel: no more batches
+                            return
+                except Exception as exc:
+                    frames_in.publish(exc)  # propagate errors downstream
+
+            def _infer() -> None:
+                # Sole owner of this job's smoother; the shared detector locks itself.
+                start = 0
+                try:
+                    while True:
+                        item = frames_in.take()
+                        if item is None or isinstance(item, Exception):
+                            frames_out.publish(item)
+                            return
+                        src, n = item
+                        dst = frames_out.acquire()
+                        if dst is None:
+                            return
+                        self._render_batch(
+                            frames_in.slots[src][:n], start, width, height, fps, frames_out.slots[dst][:n]
+                        )
+                        frames_in.release(src)
+                        frames_out.publish((dst, n))
+                        start += n
+                except Exception as exc:
+                    frames_out.publish(exc)
+
+            threads = [
+                threading.Thread(target=_reader, name="frame-reader", daemon=True),
+                threading.Thread(target=_infer, name="frame-infer", daemon=True),
+            ]
+            for t in threads:
+                t.start()
+
+            upload_errors: list = []
+
+            def _upload() -> None:
+                try:
+                    self.io.upload_stream(_EncoderOutput(proc), output_uri, "video/mp4")
+                except _EncoderFailed:
+                    pass  # reported below, with the encoder's stderr
+                except Exception as exc:
+                    upload_errors.append(exc)
+                    proc.kill()  # unblocks the frame writes below
+
+            def _encode_failed() -> ProcessingError:
+                stderr_f.seek(0)
+                return ProcessingError(f"ffmpeg encode failed: {_stderr_tail(stderr_f.read(), src, src_name)}")
 
-        with tempfile.TemporaryFile() as stderr_f:
-            proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=stderr_f)
+            uploader = threading.Thread(target=_upload, name="upload", daemon=True)
+            if output_uri:
+                uploader.start()
             try:
                 total = 0
                 last_logged = 0
                 while True:
-                    item = frame_queue.get()
+                    item = frames_out.take()
                     if item is None:
                         break
                     if isinstance(item, Exception):
                         raise item
-                    self._write_batch(item, proc, width, height, fps)
-                    total += len(item)
+                    slot, n = item
+                    for out_frame in frames_out.slots[slot][:n]:
+                        # Write the slot's buffer directly instead of copying it
+                        # into a bytes object; each frame is C-contiguous.
+                        proc.stdin.write(memoryview(out_frame).cast("B"))
+                    frames_out.release(slot)
+                    total += n
                     if total - last_logged >= 64:
                         self.logger.info("processed_frames n=%d", total)
                         last_logged = total
-            except Exception:
+            except Exception as exc:
+                # A failed upload kills the encoder, which surfaces here as a
+                # broken pipe; report the upload error instead. A broken pipe
+                # without one means the encoder failed by itself.
+                upload_failed = bool(upload_errors)
                 proc.kill()
                 proc.wait()
+                if output_uri:
+                    uploader.join(timeout=5)
+                if upload_failed:
+                    raise upload_errors[0]
+                if isinstance(exc, BrokenPipeError):
+                    raise _encode_failed() from None
                 raise
             finally:
-                cap.release()
-                reader_thread.join(timeout=5)
-                if reader_thread.is_alive():
-                    self.logger.warning("reader_thread_timeout — frame reader did not exit cleanly")
+                frames_in.close()
+                frames_out.close()
+                if decoder.poll() is None:
+                    decoder.kill()  # unblocks a reader waiting on the pipe
+                for t in threads:
+                    t.join(timeout=5)
+                    if t.is_alive():
+                        self.logger.warning("pipeline_thread_timeout thread=%s did not exit cleanly", t.name)
+                decoder.wait()
+                decoder.stdout.close()
 
-            proc.stdin.close()
+            try:
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass  # encoder already gone; reported below
             proc.wait()
+            if output_uri:
+                uploader.join()
+                proc.stdout.close()
+            # A failed upload kills the encoder, so check it first: the
+            # encoder's exit code would only hide the real error. Encoder
+            # failures never count as upload errors (see _upload).
+            if upload_errors:
+                raise upload_errors[0]
             if proc.returncode != 0:
-                stderr_f.seek(0)
-                raise ProcessingError(
-                    f"ffmpeg encode failed: {stderr_f.read().decode(errors='replace')[-800:]}"
-                )
-
-    def _write_batch(self, buf: list, proc, width: int, height: int, fps: float) -> None:
-        """Run YOLO on a batch of frames and pipe cropped output to ffmpeg."""
-        frames = [f for _, f in buf]
-        dets = self.detector.detect_union_xyxy_batch(frames)
-        for (fidx, frame), det in zip(buf, dets):
-            crop = self._compute_crop(det, frame.shape[1], frame.shape[0])
-            cropped = self._crop_and_letterbox(frame, crop, (width, height))
-            if self.cfg.draw_timestamp:
-                self._draw_timestamp(cropped, fidx, fps)
-            proc.stdin.write(cropped.tobytes())
-
-    def _compute_crop(
-        self, det: Optional[Tuple[int, int, int, int]], w: int, h: int
-    ) -> Tuple[int, int, int, int]:
-        if det is None:
-            # No persons in this frame — return the full frame unchanged.
-            return 0, 0, w, h
-
-        x1, y1, x2, y2 = det
-
-        # padding
-        bw = max(1, x2 - x1)
-        bh = max(1, y2 - y1)
-        pad_x = int(self.cfg.padding_ratio * bw)
-        pad_y = int(self.cfg.padding_ratio * bh)
-
-        x1 = max(0, x1 - pad_x)
-        y1 = max(0, y1 - pad_y)
-        x2 = min(w, x2 + pad_x)
-        y2 = min(h, y2 + pad_y)
-
-        # enforce min crop ratio (area)
-        min_area = self.cfg.min_crop_ratio * (w * h)
-        cur_area = max(1, (x2 - x1) * (y2 - y1))
-        if cur_area < min_area:
-            # expand around center
-            cx = (x1 + x2) / 2.0
-            cy = (y1 + y2) / 2.0
-            target_area = min_area
-            target_side = math.sqrt(target_area)  # approx square; will be aspect corrected below
-            tw = target_side
-            th = target_side
-            x1 = int(max(0, cx - tw / 2))
-            x2 = int(min(w, cx + tw / 2))
-            y1 = int(max(0, cy - th / 2))
-            y2 = int(min(h, cy + th / 2))
-
-        # aspect keep: expand crop window to match original aspect
-        if self.cfg.keep_aspect:
-            target_aspect = w / h
-            cw = max(1, x2 - x1)
-            ch = max(1, y2 - y1)
-            cur_aspect = cw / ch
-
-            cx = (x1 + x2) / 2.0
-            cy = (y1 + y2) / 2.0
-
-            if cur_aspect > target_aspect:
-                # too wide -> increase height
-                new_h = cw / target_aspect
-                y1 = int(max(0, cy - new_h / 2))
-                y2 = int(min(h, cy + new_h / 2))
+                raise _encode_failed()
+
+    def _video_decoder_args(self) -> list:
+        """ffmpeg input args: NVDEC on GPU hosts (ffmpeg falls back to software per stream if it can't)."""
+        return ["-hwaccel", "cuda"] if self._use_cuda else []
+
+    def _video_encoder_args(self) -> list:
+        """ffmpeg video codec args: NVENC when selected (or probed) for this host, else libx264."""
+        quality = str(self.cfg.crf)
+        if self._use_nvenc:
+            return [
+                "-c:v", "h264_nvenc",
+                "-gpu", "0",
+                "-preset", "p4",
+                "-tune", "hq",
+                "-rc", "vbr",
+                "-cq", quality,
+                "-b:v", "0",
+                "-pix_fmt", "yuv420p",
+            ]
+        # Without -pix_fmt, bgr24 input makes libx264 pick 4:4:4, which many players can't decode.
+        return ["-c:v", "libx264", "-preset", "fast", "-crf", quality, "-pix_fmt", "yuv420p"]
+
+    def _render_batch(
+        self, frames: np.ndarray, start: int, width: int, height: int, fps: float, out: np.ndarray
+    ) -> None:
+        """
+        Run YOLO on a (B, H, W, 3) batch whose first frame has index `start`
+        and render the cropped output frames into `out` (B, height, width, 3).
+        """
+        h, w = frames.shape[1:3]
+        # On CUDA the batch is uploaded once and both YOLO preprocessing and the
+        # crop/letterbox run on the device copy.
+        frames_gpu = self._upload_frames(frames) if self._use_cuda else None
+
+        # Only every detect_stride-th frame goes through YOLO + the smoother;
+        # frames in between reuse the last crop window, as do keyframes that
+        # repeat the frame before them.
+        stride = max(1, self.cfg.detect_stride)
+        dup = self._duplicate_frames(frames)
+        keys = [i for i in range(len(frames)) if (start + i) % stride == 0 and not dup[i]]
+        n = len(frames)
+        key_crops = np.empty((0, 4), dtype=np.int64)
+        if keys:
+            if frames_gpu is not None:
+                det_frames = frames_gpu if len(keys) == n else frames_gpu[keys]
             else:
-                # too tall -> increase width
-                new_w = ch * target_aspect
-                x1 = int(max(0, cx - new_w / 2))
-                x2 = int(min(w, cx + new_w / 2))
-
-        # clamp and smooth
-        x1, y1, x2, y2 = self._clamp_box((x1, y1, x2, y2), w, h)
-        sx1, sy1, sx2, sy2 = self.smoother.update((float(x1), float(y1), float(x2), float(y2)))
-        return self._clamp_box((int(sx1), int(sy1), int(sx2), int(sy2)), w, h)
+                det_frames = [frames[i] for i in keys]
+            xyxy, valid = self.detector.detect_union_xyxy_batch(det_frames)
+            key_crops = self._compute_crops(xyxy, valid, w, h)
+        # Row 0 is the window carried over from the previous batch; every frame
+        # takes the row of the latest keyframe at or before it.
+        carried = self._last_crop if self._last_crop is not None else (0, 0, w, h)
+        table = np.vstack([np.asarray(carried, dtype=np.int64)[None, :], key_crops])
+        owner = np.searchsorted(keys, np.arange(n), side="right")
+        crops = table[owner].tolist()
+        self._last_crop = tuple(crops[-1])
+
+        if frames_gpu is not None:
+            self._crop_and_letterbox_batch_gpu(frames_gpu, crops, out)
+        else:
+            for i, (frame, crop, canvas) in enumerate(zip(frames, crops, out)):
+                if dup[i]:
+                    # Same pixels and (never a keyframe) same crop as frame i - 1.
+                    np.copyto(canvas, out[i - 1])
+                else:
+                    self._crop_and_letterbox(frame, crop, canvas)
+        if self.cfg.draw_timestamp:
+            for i, canvas in enumerate(out):
+                self._draw_timestamp(canvas, start + i, fps)
 
     @staticmethod
-    def _clamp_box(box: Tuple[int, int, int, int], w: int, h: int) -> Tuple[int, int, int, int]:
-        x1, y1, x2, y2 = box
-        x1 = max(0, min(w - 1, x1))
-        y1 = max(0, min(h - 1, y1))
-        x2 = max(x1 + 1, min(w, x2))
-        y2 = max(y1 + 1, min(h, y2))
-        return x1, y1, x2, y2
+    def _duplicate_frames(frames: np.ndarray) -> np.ndarray:
+        """
+        Bool [B] mask of frames identical to the frame before them in the
+        batch (paused or frozen footage). Comparing every 16th pixel first
+        rules out almost all changed frames for ~1/256 of a full compare.
+        """
+        dup = np.zeros(len(frames), dtype=bool)
+        if len(frames) < 2:
+            return dup
+        sample = frames[:, ::16, ::16]
+        dup[1:] = (sample[1:] == sample[:-1]).reshape(len(frames) - 1, -1).all(axis=1)
+        for i in np.flatnonzero(dup):
+            dup[i] = np.array_equal(frames[i], frames[i - 1])
+        return dup
+
+    def _compute_crops(self, xyxy: np.ndarray, valid: np.ndarray, w: int, h: int) -> np.ndarray:
+        """
+        Smoothed crop windows for detector output (int [B, 4] boxes and a
+        bool [B] mask, in frame order), as a single compiled call. Returns
+        int64 [B, 4]; frames without persons get the full frame.
+        """
+        return self.smoother.crops(
+            xyxy, valid, w, h,
+            self.cfg.padding_ratio, self.cfg.min_crop_ratio, self.cfg.keep_aspect,
+        )
 
-    def _crop_and_letterbox(self, frame: np.ndarray, crop: Tuple[int, int, int, int], out_size: Tuple[int, int]) -> np.ndarray:
+    def _crop_and_letterbox(self, frame: np.ndarray, crop: Tuple[int, int, int, int], canvas: np.ndarray) -> None:
         """
-        Crop and then resize back to original size (letterboxing if needed to preserve aspect).
-        Output is always the original WxH so downstream users don't have to handle varying dims.
+        Crop and then resize back into `canvas`, which has the original size
+        (letterboxing if needed to preserve aspect), so downstream users don't
+        have to handle varying dims.
+
+        The canvas is a reused buffer: the resize writes straight into it and
+        only the letterbox margins are cleared, not the whole frame.
         """
-        out_w, out_h = out_size
+        out_h, out_w = canvas.shape[:2]
         x1, y1, x2, y2 = crop
         cropped = frame[y1:y2, x1:x2]
 
         if cropped.size == 0:
-            return frame
+            canvas[:] = frame
+            return
+
+        new_w, new_h, x_off, y_off = self._letterbox_geometry(crop, (out_w, out_h))
+        canvas[:y_off] = 0
+        canvas[y_off + new_h:] = 0
+        canvas[y_off:y_off + new_h, :x_off] = 0
+        canvas[y_off:y_off + new_h, x_off + new_w:] = 0
+        cv2.resize(
+            cropped, (new_w, new_h),
+            dst=canvas[y_off:y_off + new_h, x_off:x_off + new_w],
+            interpolation=cv2.INTER_LINEAR,
+        )
+
+    def _upload_frames(self, frames: np.ndarray) -> Any:
+        """
+        Copy a frame batch to the GPU as a (B, H, W, 3) uint8 tensor.
+
+        The non-blocking copy is issued on a side stream and the current
+        stream waits on an event recorded after it, so the CPU goes straight
+        on to queue the work that consumes the batch.
+        """
+        import torch
+
+        if self._copy_stream is None:
+            self._copy_stream = torch.cuda.Stream()
+        with torch.cuda.stream(self._copy_stream):
+            # pin_memory() is a no-op for FrameRing's pinned buffers.
+            src = torch.from_numpy(np.ascontiguousarray(frames)).pin_memory().to("cuda", non_blocking=True)
+            ready = torch.cuda.Event()
+            ready.record()
+        stream = torch.cuda.current_stream()
+        stream.wait_event(ready)
+        src.record_stream(stream)  # allocated on the copy stream, used on this one
+        return src
+
+    def _crop_and_letterbox_batch_gpu(self, src: Any, crops: list, out: np.ndarray) -> None:
+        """
+        CUDA variant of _crop_and_letterbox for a whole batch.
+
+        Takes the device batch from _upload_frames, does a bilinear resize per
+        run of equal crops on the device, and one D2H download of the finished canvases into
+        `out` (B, H, W, 3), instead of B separate cv2.resize + canvas copies on
+        the CPU.
+        """
+        import torch
+        import torch.nn.functional as F
+
+        out_h, out_w = out.shape[1:3]
+        out_size = (out_w, out_h)
+        with torch.inference_mode():
+            canvases = torch.zeros((len(src), out_h, out_w, 3), dtype=torch.uint8, device="cuda")
+            i = 0
+            while i < len(crops):
+                # Consecutive frames usually share a window (every frame between
+                # keyframes, and a stationary subject across keyframes), so
+                # each run of equal crops is resized as one batch.
+                j = i + 1
+                while j < len(crops) and crops[j] == crops[i]:
+                    j += 1
+                x1, y1, x2, y2 = crops[i]
+                new_w, new_h, x_off, y_off = self._letterbox_geometry(crops[i], out_size)
+                region = src[i:j, y1:y2, x1:x2]
+                if (new_w, new_h) != (x2 - x1, y2 - y1):
+                    nchw = region.permute(0, 3, 1, 2).float()
+                    nchw = F.interpolate(nchw, size=(new_h, new_w), mode="bilinear", align_corners=False)
+                    region = nchw.permute(0, 2, 3, 1).round_().clamp_(0, 255).to(torch.uint8)
+                canvases[i:j, y_off:y_off + new_h, x_off:x_off + new_w] = region
+                i = j
+            torch.from_numpy(out).copy_(canvases)
+
+    def _letterbox_geometry(
+        self, crop: Tuple[int, int, int, int], out_size: Tuple[int, int]
+    ) -> Tuple[int, int, int, int]:
+        """Resized crop size and its offset on the output canvas: (new_w, new_h, x_off, y_off)."""
+        out_w, out_h = out_size
+        x1, y1, x2, y2 = crop
+        cw, ch = x2 - x1, y2 - y1
 
         # Prevent upscaling beyond original by limiting scale (optional).
-        ch, cw = cropped.shape[:2]
         scale = min(out_w / cw, out_h / ch)
         if self.cfg.max_upscale <= 1.0:
             scale = min(scale, 1.0)
 
         new_w = max(1, int(cw * scale))
         new_h = max(1, int(ch * scale))
-        resized = cv2.resize(cropped, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
-
-        canvas = np.zeros((out_h, out_w, 3), dtype=np.uint8)
-        x_off = (out_w - new_w) // 2
-        y_off = (out_h - new_h) // 2
-        canvas[y_off:y_off + new_h, x_off:x_off + new_w] = resized
-        return canvas
+        return new_w, new_h, (out_w - new_w) // 2, (out_h - new_h) // 2
 
     def _draw_timestamp(self, frame: np.ndarray, idx: int, fps: float) -> None:
         t = idx / fps
@@ -465,6 +1567,51 @@ class VideoCropper:
         ms = int((t - int(t)) * 1000)
         label = f"{hh:02d}:{mm:02d}:{ss:02d}.{ms:03d}"
 
+        h, w = frame.shape[:2]
+        margin = int(self.cfg.timestamp_margin_px)
+
+        strip = self._timestamp_prefix_strip(label[:-3])
+        cell_h, box_w = strip.shape[:2]
+        tw = box_w - 12
+        x = max(margin, w - margin - tw)
+        y0 = margin - 6  # top of the background box
+
+        if y0 < 0 or y0 + cell_h > h or x + tw + 6 > w:
+            # Frame too small for the box; let OpenCV clip it.
+            self._draw_timestamp_cv2(frame, label)
+            return
+
+        # Box and "HH:MM:SS." in one copy, then the three millisecond digits.
+        frame[y0:y0 + cell_h, x - 6:x + tw + 6] = strip
+        digit_w = self._glyphs["0"].shape[1]
+        x += tw - 3 * digit_w
+        for c in label[-3:]:
+            frame[y0:y0 + cell_h, x:x + digit_w] = self._glyphs[c]
+            x += digit_w
+
+    def _timestamp_prefix_strip(self, prefix: str) -> np.ndarray:
+        """
+        The black background box (6 px side padding) with every label
+        character but the millisecond digits already in place, i.e. what
+        stays the same for a whole second of frames. Rebuilt when `prefix`
+        changes.
+        """
+        cached = self._timestamp_strip
+        if cached is not None and cached[0] == prefix:
+            return cached[1]
+        cells = [self._glyphs[c] for c in prefix]
+        digit_w = self._glyphs["0"].shape[1]
+        tw = sum(cell.shape[1] for cell in cells) + 3 * digit_w
+        strip = np.zeros((cells[0].shape[0], tw + 12, 3), dtype=np.uint8)
+        x = 6
+        for cell in cells:
+            cw = cell.shape[1]
+            strip[:, x:x + cw] = cell
+            x += cw
+        self._timestamp_strip = (prefix, strip)
+        return strip
+
+    def _draw_timestamp_cv2(self, frame: np.ndarray, label: str) -> None:
         _h, w = frame.shape[:2]
         margin = int(self.cfg.timestamp_margin_px)
 
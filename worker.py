@@ -16,7 +16,9 @@ Responsibilities:
 
 from __future__ import annotations
 
+import hmac
 import logging
+import threading
 from datetime import datetime, timezone
 from typing import Any, Dict
 
@@ -24,10 +26,14 @@ from flask import Blueprint, request, jsonify, current_app
 from google.cloud import firestore
 
 from video_cropper import VideoCropper, CropperConfig, ProcessingError
-from logging_utils import setup_logging
+
+logger = logging.getLogger(__name__)
 
 worker_bp = Blueprint("worker", __name__)
 
+# Startup warm-up and /process can both reach get_cropper() first.
+_cropper_lock = threading.Lock()
+
 
 def now_utc() -> datetime:
     return datetime.now(timezone.utc)
@@ -37,27 +43,36 @@ def get_cropper() -> VideoCropper:
     """
     Return a singleton VideoCropper instance.
 
-    Model loading is expensive; do it once per container process.
+    Model loading is expensive; do it once per container process, including
+    a warm-up inference. api.create_app calls this at startup so a cold
+    start doesn't land on the first job.
     """
     cropper = current_app.extensions.get("cropper")
     if cropper is None:
-        cfg: CropperConfig = current_app.config["CROPPER_CONFIG"]
-        cropper = VideoCropper(cfg, logging.getLogger("video_cropper"))
-        current_app.extensions["cropper"] = cropper
+        with _cropper_lock:
+            cropper = current_app.extensions.get("cropper")
+            if cropper is None:
+                cfg: CropperConfig = current_app.config["CROPPER_CONFIG"]
+                cropper = VideoCropper(cfg, logging.getLogger("video_cropper"))
+                try:
+                    cropper.warmup()
+                except Exception:
+                    # The job will hit (and report) the same error.
+                    logger.exception("cropper_warmup_failed")
+                current_app.extensions["cropper"] = cropper
     return cropper
 
 
 @worker_bp.post("/process")
 def process() -> Any:
-    setup_logging()
-    logger = logging.getLogger(__name__)
-
     process_token = current_app.config.get("PROCESS_TOKEN")
     if not process_token:
         logger.error("process_missing_token_config")
         return jsonify({"ok": False, "error": "Missing PROCESS_TOKEN configuration"}), 500
 
-    if request.headers.get("X-Process-Token") != process_token:
+    # Constant-time compare; the length guard cheaply rejects malformed tokens.
+    token = request.headers.get("X-Process-Token", "")
+    if len(token) != len(process_token) or not hmac.compare_digest(token.encode(), process_token.encode()):
         return jsonify({"ok": False, "error": "Unauthorized"}), 401
 
     data: Dict[str, Any] = request.get_json(silent=True) or {}